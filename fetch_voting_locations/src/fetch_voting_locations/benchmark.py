@@ -0,0 +1,282 @@
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+import typing
+
+import pandas as pd
+import geopandas as gpd
+from shapely import box
+
+from fetch_voting_locations.geocoding import geocode_location
+from fetch_voting_locations.geospatial import generate_polling_place_gdf, generate_location_store_gdf, \
+    check_polling_locations_against_boundaries
+from fetch_voting_locations.location_files import ALL_LOCATIONS_ID
+from fetch_voting_locations.location_store import build_location_store, save_location_store, load_location_store
+from fetch_voting_locations.scenarios import generate_voting_location_subsets
+from fetch_voting_locations.scrape import fetch_early_voting_locations
+from fetch_voting_locations.utils.file_cached_function import FileCachedFunction
+from fetch_voting_locations.utils.replay import ReplayServer, replay_mapbox_geocoding, \
+    write_sos_fixtures_for_election, get_sos_fixture_file_url
+
+# roughly the extent of Georgia, used so synthetic coordinates look like real ones
+SYNTHETIC_STATE_BOUNDS = (-85.6, 30.4, -80.8, 35.0)
+
+
+def synthetic_county_names(counties: int) -> typing.List[str]:
+    return [f'COUNTY{i:03d}' for i in range(counties)]
+
+
+def generate_synthetic_boundaries(counties: int = 159) -> gpd.GeoDataFrame:
+    min_x, min_y, max_x, max_y = SYNTHETIC_STATE_BOUNDS
+    columns = max(1, int(counties ** 0.5))
+    rows = (counties + columns - 1) // columns
+    width = (max_x - min_x) / columns
+    height = (max_y - min_y) / rows
+    data = []
+    for i, county in enumerate(synthetic_county_names(counties)):
+        x = min_x + (i % columns) * width
+        y = min_y + (i // columns) * height
+        data.append(dict(NAME=county, name=county.title(), geometry=box(x, y, x + width, y + height)))
+    return gpd.GeoDataFrame(pd.DataFrame(data), geometry='geometry', crs='EPSG:4326')
+
+
+def generate_synthetic_schedule(start_date: datetime.date, scenario_days: int, schedule_lines: int,
+                                rng: random.Random) -> typing.List[str]:
+    schedule = []
+    span_days = max(1, scenario_days // max(1, schedule_lines))
+    day = start_date
+    for _ in range(schedule_lines):
+        end = day + datetime.timedelta(days=rng.randint(0, span_days - 1))
+        start_hour = rng.choice([7, 8, 9, 12])
+        end_hour = rng.choice([5, 6, 7])
+        schedule.append(f'{day.strftime("%m/%d/%Y")} - {end.strftime("%m/%d/%Y")} '
+                        f'{start_hour}:00 {"PM" if start_hour == 12 else "AM"} - {end_hour}:00 PM '
+                        f'( Advanced Polling Location )')
+        day = end + datetime.timedelta(days=1)
+    return schedule
+
+
+def generate_synthetic_locations(counties: int = 159, locations_per_county: int = 20, schedule_lines: int = 6,
+                                 start_date: datetime.date = datetime.date(2026, 4, 27), scenario_days: int = 19,
+                                 boundaries: gpd.GeoDataFrame = None, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    if boundaries is None:
+        boundaries = generate_synthetic_boundaries(counties)
+    county_bounds = {row['NAME']: row['geometry'].bounds for _, row in boundaries.iterrows()}
+    all_locations = {}
+    for county in synthetic_county_names(counties):
+        min_x, min_y, max_x, max_y = county_bounds[county]
+        locations = []
+        for i in range(locations_per_county):
+            locations.append(dict(
+                address=f'{100 + i} MAIN STREET, {county}, GA, 3{rng.randint(0, 9999):04d}',
+                county=county,
+                election='SYNTHETIC ELECTION',
+                lat=rng.uniform(min_y, max_y),
+                lng=rng.uniform(min_x, max_x),
+                name=f'{county} POLLING PLACE {i}',
+                schedule=generate_synthetic_schedule(start_date, scenario_days, schedule_lines, rng)
+            ))
+        all_locations[county] = locations
+    all_locations[ALL_LOCATIONS_ID] = [location for county in synthetic_county_names(counties)
+                                       for location in all_locations[county]]
+    return all_locations
+
+
+def generate_synthetic_scenarios(start_date: datetime.date = datetime.date(2026, 4, 27),
+                                 scenario_days: int = 19) -> dict:
+    end_date = start_date + datetime.timedelta(days=scenario_days - 1)
+    scenarios = {}
+    for scenario_name, time_filter in [('any_time', None), ('before_9_am', '08:30:00'), ('after_5_pm', '17:30:00')]:
+        scenarios[scenario_name] = dict(start_date=start_date.isoformat(), end_date=end_date.isoformat(),
+                                        info=dict(name=scenario_name, description=scenario_name))
+        if time_filter is not None:
+            scenarios[scenario_name]['time_filter'] = time_filter
+    return scenarios
+
+
+def time_function(function: typing.Callable, repeat: int = 3, setup: typing.Callable = None) -> float:
+    timings = []
+    for _ in range(repeat):
+        arguments = setup() if setup is not None else ()
+        start = time.perf_counter()
+        function(*arguments)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_file_cached_function(cache_directory: str, entries: int, repeat: int = 3) -> dict:
+    def fake_geocode(query: str = None):
+        return dict(type='FeatureCollection', features=[dict(
+            type='Feature', geometry=dict(type='Point', coordinates=[-84.0, 33.0]),
+            properties=dict(full_address=query, match_code=dict(confidence='exact')))])
+
+    queries = [f'{i} MAIN STREET, ATLANTA, GA, 30303' for i in range(entries)]
+    results = {}
+    runs = iter(range(repeat))
+
+    def miss_setup():
+        return FileCachedFunction(fake_geocode, os.path.join(cache_directory, f'miss_{next(runs)}')),
+
+    def call_all(cached_function):
+        for query in queries:
+            cached_function(query=query)
+
+    results['file_cached_function.miss'] = time_function(call_all, repeat, miss_setup)
+    hit_directory = os.path.join(cache_directory, 'hit')
+    call_all(FileCachedFunction(fake_geocode, hit_directory))
+    results['file_cached_function.hit_disk'] = time_function(
+        call_all, repeat, lambda: (FileCachedFunction(fake_geocode, hit_directory),))
+    warm_cached_function = FileCachedFunction(fake_geocode, hit_directory)
+    call_all(warm_cached_function)
+    results['file_cached_function.hit_memory'] = time_function(call_all, repeat, lambda: (warm_cached_function,))
+    return results
+
+
+def run_benchmarks(counties: int = 159, locations_per_county: int = 20, schedule_lines: int = 6,
+                   scenario_days: int = 19, cache_entries: int = 500, repeat: int = 3, seed: int = 0) -> dict:
+    start_date = datetime.date(2026, 4, 27)
+    boundaries = generate_synthetic_boundaries(counties)
+    all_locations = generate_synthetic_locations(counties, locations_per_county, schedule_lines, start_date,
+                                                 scenario_days, boundaries, seed)
+    scenarios = generate_synthetic_scenarios(start_date, scenario_days)
+    county_names = synthetic_county_names(counties)
+    results = {}
+    with tempfile.TemporaryDirectory() as working_directory:
+        results['build_location_store'] = time_function(build_location_store, repeat,
+                                                        lambda: (all_locations, county_names))
+        location_store = build_location_store(all_locations, county_names)
+        save_location_store(working_directory, location_store)
+        results['load_location_store'] = time_function(load_location_store, repeat, lambda: (working_directory,))
+        runs = iter(range(repeat * 2))
+        results['generate_voting_location_subsets.cold'] = time_function(
+            generate_voting_location_subsets, repeat,
+            lambda: (location_store, scenarios, os.path.join(working_directory, f'scenarios_{next(runs)}')))
+        warm_directory = os.path.join(working_directory, 'scenarios_warm')
+        generate_voting_location_subsets(location_store, scenarios, warm_directory)
+        results['generate_voting_location_subsets.warm'] = time_function(
+            generate_voting_location_subsets, repeat, lambda: (location_store, scenarios, warm_directory))
+        results['generate_location_store_gdf'] = time_function(generate_location_store_gdf, repeat,
+                                                               lambda: (location_store.locations,))
+
+        def generate_all_gdfs():
+            return [generate_polling_place_gdf(all_locations[county]) for county in county_names]
+
+        results['generate_polling_place_gdf'] = time_function(generate_all_gdfs, repeat)
+        county_gdfs = generate_all_gdfs()
+        all_locations_gdf = gpd.GeoDataFrame(pd.concat(county_gdfs))
+        results['check_polling_locations_against_boundaries'] = time_function(
+            check_polling_locations_against_boundaries, repeat, lambda: (all_locations_gdf, boundaries))
+
+        geojson_directory = os.path.join(working_directory, 'geojson')
+        os.makedirs(geojson_directory, exist_ok=True)
+
+        def write_geojson():
+            for county, county_gdf in zip(county_names, county_gdfs):
+                county_gdf.to_file(os.path.join(geojson_directory, f'{county}.geojson'), driver='GeoJSON')
+            all_locations_gdf.to_file(os.path.join(geojson_directory, f'{ALL_LOCATIONS_ID}.geojson'),
+                                      driver='GeoJSON')
+
+        results['geojson_output'] = time_function(write_geojson, repeat)
+        results.update(benchmark_file_cached_function(os.path.join(working_directory, 'cache'), cache_entries,
+                                                      repeat))
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float = 0.25,
+                        noise_floor_seconds: float = 0.05) -> dict:
+    regressions = {}
+    for stage, seconds in results.items():
+        baseline_seconds = baseline.get(stage)
+        if baseline_seconds is None or seconds - baseline_seconds < noise_floor_seconds:
+            continue
+        if seconds > baseline_seconds * (1 + tolerance):
+            regressions[stage] = dict(baseline_seconds=baseline_seconds, seconds=seconds,
+                                      slowdown=seconds / baseline_seconds)
+    return regressions
+
+
+def run_replay_benchmarks(election_directory: str, fixture_directory: str = 'replay_fixtures',
+                          geocode_latency_seconds: float = 0.05, page_latency_seconds: float = 0.5,
+                          counties: typing.List[str] = None, scrape: bool = False, state: str = 'Georgia',
+                          scrape_files: bool = False) -> dict:
+    election_id = os.path.basename(os.path.normpath(election_directory))
+    write_sos_fixtures_for_election(election_directory, fixture_directory)
+    with open(os.path.join(election_directory, 'county_boundaries', f'{state}_bounds.json'), 'rt') as in_file:
+        county_bounding_boxes = json.load(in_file)
+    if counties is None:
+        with open(os.path.join(election_directory, 'counties.json'), 'rt') as in_file:
+            counties = json.load(in_file)
+    county_locations = {}
+    for county in counties:
+        county_file = os.path.join(election_directory, 'json', f'{county}.json')
+        if os.path.isfile(county_file):
+            with open(county_file, 'rt') as in_file:
+                county_locations[county] = json.load(in_file)
+    results = {}
+    with ReplayServer(fixture_directory, geocode_latency_seconds=geocode_latency_seconds,
+                      page_latency_seconds=page_latency_seconds) as server:
+        with tempfile.TemporaryDirectory() as cache_directory, replay_mapbox_geocoding(server, cache_directory):
+            geocoded = 0
+            start = time.perf_counter()
+            for county, locations in county_locations.items():
+                bounding_box = county_bounding_boxes.get(county.replace(' ', ''))
+                for location in locations:
+                    location = {k: v for k, v in location.items() if k not in ('lat', 'lng')}
+                    geocode_location(location, bounding_box=tuple(bounding_box) if bounding_box else None)
+                    geocoded += 'lat' in location and 'lng' in location
+            seconds = time.perf_counter() - start
+            results['replay.geocode'] = dict(seconds=seconds, locations=geocoded,
+                                             locations_per_second=geocoded / seconds if seconds > 0 else None)
+        if scrape:
+            scraped = 0
+            start = time.perf_counter()
+            # file pages skip the server, and with it the injected page latency
+            base_url = get_sos_fixture_file_url(fixture_directory) if scrape_files else server.sos_locations_url
+            for county in county_locations.keys():
+                scraped += len(fetch_early_voting_locations(election_id, county, base_url=base_url))
+            seconds = time.perf_counter() - start
+            results['replay.scrape'] = dict(seconds=seconds, locations=scraped,
+                                            locations_per_second=scraped / seconds if seconds > 0 else None)
+    for stage in sorted(results.keys()):
+        print(f'{stage:<20}{results[stage]["seconds"]:>10.3f}s{results[stage]["locations"]:>8} locations'
+              f'{results[stage]["locations_per_second"] or 0:>10.1f}/s')
+    return results
+
+
+def main(baseline_file: str = 'benchmark_baseline.json', update_baseline: bool = False, tolerance: float = 0.25,
+         counties: int = 159, locations_per_county: int = 20, schedule_lines: int = 6, scenario_days: int = 19,
+         cache_entries: int = 500, repeat: int = 3) -> dict:
+    parameters = dict(counties=counties, locations_per_county=locations_per_county, schedule_lines=schedule_lines,
+                      scenario_days=scenario_days, cache_entries=cache_entries, repeat=repeat)
+    results = run_benchmarks(**parameters)
+    for stage in sorted(results.keys()):
+        print(f'{stage:<50}{results[stage]:>10.4f}s')
+    regressions = {}
+    baseline = None
+    if os.path.isfile(baseline_file):
+        with open(baseline_file, 'rt') as in_file:
+            baseline = json.load(in_file)
+    if update_baseline:
+        with open(baseline_file, 'wt') as out_file:
+            json.dump(dict(parameters=parameters, results=results), out_file, indent=4, sort_keys=True)
+        print(f'Saved benchmark baseline to {baseline_file}')
+    elif baseline is None:
+        print(f'No benchmark baseline found at {baseline_file}; run with --update-baseline to create one.')
+    elif baseline.get('parameters') != parameters:
+        print(f'Benchmark parameters differ from baseline {baseline_file}; skipping comparison.')
+    else:
+        regressions = compare_to_baseline(results, baseline['results'], tolerance)
+        for stage, regression in sorted(regressions.items()):
+            print(f'Regression in {stage}: {regression["seconds"]:.4f}s vs baseline '
+                  f'{regression["baseline_seconds"]:.4f}s ({regression["slowdown"]:.2f}x)')
+        if len(regressions) == 0:
+            print(f'No stages regressed more than {tolerance:.0%} against {baseline_file}.')
+    return regressions
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import os
+import typing
+
+import numpy as np
+
+from fetch_voting_locations.location_files import ALL_LOCATIONS_ID, load_json_file, write_json_file_atomically
+from fetch_voting_locations.utils.profiling import profiled, profile_span
+
+CLUSTERS_DIRECTORY = 'clusters'
+# the zoom range of the map in get_voting_locations.js
+MIN_CLUSTER_ZOOM = 7
+MAX_CLUSTER_ZOOM = 18
+TILE_SIZE_PIXELS = 256
+# a power of two, so each cell splits into exactly four cells at the next zoom level
+CLUSTER_CELL_SIZE_PIXELS = 64
+CLUSTER_LOCATION_COLUMNS = ['lat', 'lng']
+
+
+def to_web_mercator(lat, lng) -> typing.Tuple[np.ndarray, np.ndarray]:
+    # fractions of the world width and height, as used by the map tiles
+    lat = np.clip(np.asarray(lat, dtype=float), -85.05112878, 85.05112878)
+    x = (np.asarray(lng, dtype=float) + 180) / 360
+    y = (1 - np.log(np.tan(np.radians(lat)) + 1 / np.cos(np.radians(lat))) / np.pi) / 2
+    return x, y
+
+
+def get_cells_per_axis(zoom: int, cell_size_pixels: int = CLUSTER_CELL_SIZE_PIXELS) -> int:
+    return (2 ** zoom) * TILE_SIZE_PIXELS // cell_size_pixels
+
+
+def merge_clusters(cell_x: np.ndarray, cell_y: np.ndarray, count: np.ndarray, lat_sum: np.ndarray,
+                   lng_sum: np.ndarray, location_id: np.ndarray) -> typing.Tuple[np.ndarray, ...]:
+    keys = (cell_y.astype(np.int64) << 32) | cell_x.astype(np.int64)
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    merged_location_id = np.full(len(unique_keys), np.iinfo(np.int64).max)
+    np.minimum.at(merged_location_id, inverse, location_id)
+    return (unique_keys & 0xffffffff, unique_keys >> 32, np.bincount(inverse, count),
+            np.bincount(inverse, lat_sum), np.bincount(inverse, lng_sum), merged_location_id)
+
+
+def build_zoom_clusters(lat: np.ndarray, lng: np.ndarray, location_ids: np.ndarray,
+                        min_zoom: int = MIN_CLUSTER_ZOOM, max_zoom: int = MAX_CLUSTER_ZOOM,
+                        cell_size_pixels: int = CLUSTER_CELL_SIZE_PIXELS) -> dict:
+    # clusters are built at the deepest zoom first, then each coarser level merges the four cells below it
+    x, y = to_web_mercator(lat, lng)
+    cells_per_axis = get_cells_per_axis(max_zoom, cell_size_pixels)
+    level = merge_clusters(np.floor(x * cells_per_axis), np.floor(y * cells_per_axis), np.ones(len(location_ids)),
+                           np.asarray(lat, dtype=float), np.asarray(lng, dtype=float),
+                           np.asarray(location_ids, dtype=np.int64))
+    results = {}
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        if zoom < max_zoom:
+            cell_x, cell_y, count, lat_sum, lng_sum, location_id = level
+            level = merge_clusters(cell_x >> 1, cell_y >> 1, count, lat_sum, lng_sum, location_id)
+        cell_x, cell_y, count, lat_sum, lng_sum, location_id = level
+        count = count.astype(np.int64)
+        # columns rather than one object per cluster, which keeps the files small
+        results[zoom] = dict(
+            zoom=zoom,
+            cell_size_pixels=cell_size_pixels,
+            x=cell_x.tolist(),
+            y=cell_y.tolist(),
+            lat=np.round(lat_sum / count, 6).tolist(),
+            lng=np.round(lng_sum / count, 6).tolist(),
+            count=count.tolist(),
+            location_id=np.where(count == 1, location_id, -1).tolist(),
+        )
+    return results
+
+
+def get_clusters_directory(output_directory: str) -> str:
+    return os.path.join(output_directory, CLUSTERS_DIRECTORY)
+
+
+@profiled()
+def export_marker_clusters(locations, scenarios: dict, output_directory: str,
+                           min_zoom: int = MIN_CLUSTER_ZOOM, max_zoom: int = MAX_CLUSTER_ZOOM,
+                           cell_size_pixels: int = CLUSTER_CELL_SIZE_PIXELS,
+                           days: typing.Dict[str, typing.Collection[str]] = None) -> dict:
+    # days limits the rebuild to those scenario days; every other day keeps its existing cluster files
+    from fetch_voting_locations.scenarios import remove_stale_scenario_days
+    lat = locations['lat'].to_numpy()
+    lng = locations['lng'].to_numpy()
+    has_position = np.isfinite(lat) & np.isfinite(lng)
+    clusters_directory = get_clusters_directory(output_directory)
+    clusters_file = os.path.join(clusters_directory, 'clusters.json')
+    clusters_index = dict(min_zoom=min_zoom, max_zoom=max_zoom, cell_size_pixels=cell_size_pixels,
+                          tile_size_pixels=TILE_SIZE_PIXELS)
+    previous = load_json_file(clusters_file) if os.path.isfile(clusters_file) else {}
+    if any(previous.get(key) != value for key, value in clusters_index.items()):
+        days = None
+    results = {}
+    for scenario_name, scenario in scenarios.items():
+        results[scenario_name] = []
+        for day, open_polls in scenario.get('times', {}).items():
+            if days is not None and day not in days.get(scenario_name, ()) and \
+                    day in previous.get('days', {}).get(scenario_name, []):
+                results[scenario_name].append(day)
+                continue
+            location_ids = np.asarray(open_polls.get(ALL_LOCATIONS_ID, []), dtype=np.int64)
+            location_ids = location_ids[has_position[location_ids]]
+            if len(location_ids) == 0:
+                continue
+            with profile_span('build_zoom_clusters', scenario=scenario_name, day=day):
+                zoom_clusters = build_zoom_clusters(lat[location_ids], lng[location_ids], location_ids,
+                                                    min_zoom, max_zoom, cell_size_pixels)
+            day_directory = os.path.join(clusters_directory, scenario_name, day)
+            for zoom, clusters in zoom_clusters.items():
+                write_json_file_atomically(os.path.join(day_directory, f'{zoom}.json'), clusters,
+                                           separators=(',', ':'))
+            results[scenario_name].append(day)
+    remove_stale_scenario_days(clusters_directory, results)
+    write_json_file_atomically(clusters_file, dict(clusters_index, days=results), indent=4)
+    return results
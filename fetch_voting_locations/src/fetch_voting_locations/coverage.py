@@ -0,0 +1,186 @@
+import os
+import typing
+from functools import lru_cache
+
+import numpy as np
+import geopandas as gpd
+import shapely
+
+from fetch_voting_locations.location_files import ALL_LOCATIONS_ID, load_json_file, write_json_file_atomically
+from fetch_voting_locations.utils.profiling import profiled, profile_span
+
+COVERAGE_DIRECTORY = 'coverage'
+# an equal area projection in meters, so every grid cell covers the same area
+COVERAGE_CRS = 'EPSG:5070'
+METERS_PER_MILE = 1609.344
+DEFAULT_CELL_SIZE_MILES = 0.5
+DEFAULT_DISTANCE_THRESHOLD_MILES = 10.0
+# gap outlines are only drawn on a map, so they are simplified to about a city block and written with ~1m precision
+GAP_SIMPLIFY_TOLERANCE_METERS = 100
+GAP_COORDINATE_PRECISION = 5
+COVERAGE_LOCATION_COLUMNS = ['county_key', 'lat', 'lng']
+
+
+class CountyGrid(typing.NamedTuple):
+    # centers of the grid cells falling inside the county, in COVERAGE_CRS meters
+    x: np.ndarray
+    y: np.ndarray
+    boundary: shapely.Geometry
+
+
+def load_county_boundaries(output_directory: str, state: str = 'Georgia') -> gpd.GeoDataFrame:
+    # the boundaries saved by the validate stage, so the census input is only needed the first time
+    boundaries_file = os.path.join(output_directory, 'county_boundaries', f'{state}.geojson')
+    if os.path.isfile(boundaries_file):
+        boundaries = gpd.read_file(boundaries_file)
+    else:
+        from fetch_voting_locations.geospatial import get_state_county_boundaries
+        boundaries = get_state_county_boundaries(state)
+    return boundaries.loc[boundaries['NAME'] != '', ['NAME', 'geometry']]
+
+
+@profiled()
+def rasterize_counties(boundaries: gpd.GeoDataFrame, cell_size_meters: float) -> typing.Dict[str, CountyGrid]:
+    # one statewide grid, so cells line up across county lines
+    boundaries = boundaries.to_crs(COVERAGE_CRS)
+    west, south, east, north = boundaries.total_bounds
+    x_centers = np.arange(west + cell_size_meters / 2, east, cell_size_meters)
+    y_centers = np.arange(south + cell_size_meters / 2, north, cell_size_meters)
+    county_grids = {}
+    for county, boundary in zip(boundaries['NAME'], boundaries.geometry):
+        county_west, county_south, county_east, county_north = boundary.bounds
+        x = x_centers[(x_centers >= county_west) & (x_centers <= county_east)]
+        y = y_centers[(y_centers >= county_south) & (y_centers <= county_north)]
+        grid_x, grid_y = np.meshgrid(x, y)
+        grid_x, grid_y = grid_x.ravel(), grid_y.ravel()
+        shapely.prepare(boundary)
+        inside = shapely.contains_xy(boundary, grid_x, grid_y)
+        county_grids[county] = CountyGrid(grid_x[inside], grid_y[inside], boundary)
+    return county_grids
+
+
+def get_gap_polygon(county_grid: CountyGrid, points: typing.Optional[np.ndarray], threshold_meters: float):
+    # cut the reachable discs out of the county outline rather than merging raster cells, which is both exact and
+    # far cheaper than unioning thousands of cells for sparsely served counties
+    if points is None or len(points) == 0:
+        gap_polygon = county_grid.boundary
+    else:
+        reachable = shapely.union_all(shapely.buffer(shapely.points(points), threshold_meters))
+        gap_polygon = shapely.difference(county_grid.boundary, reachable)
+    return shapely.simplify(gap_polygon, GAP_SIMPLIFY_TOLERANCE_METERS, preserve_topology=True)
+
+
+def summarize_distances(distances_miles: np.ndarray, cell_area_square_miles: float,
+                        threshold_miles: float) -> dict:
+    # cells in a county without any open location have no distance; they count as gaps and are reported as
+    # unreachable, while the distance statistics describe the cells that can reach a location
+    reachable_distances = distances_miles[np.isfinite(distances_miles)]
+    unreachable_cells = len(distances_miles) - len(reachable_distances)
+    statistics = dict(cells=len(distances_miles),
+                      area_square_miles=round(len(distances_miles) * cell_area_square_miles, 2),
+                      unreachable_cells=unreachable_cells,
+                      unreachable_area_square_miles=round(unreachable_cells * cell_area_square_miles, 2),
+                      gap_area_square_miles=0.0, covered_fraction=None,
+                      mean_distance_miles=None, p90_distance_miles=None, max_distance_miles=None)
+    if len(distances_miles) == 0:
+        return statistics
+    gap_cells = int(np.count_nonzero(~(distances_miles <= threshold_miles)))
+    statistics.update(gap_area_square_miles=round(gap_cells * cell_area_square_miles, 2),
+                      covered_fraction=round(1 - gap_cells / len(distances_miles), 4))
+    if len(reachable_distances) > 0:
+        statistics.update(mean_distance_miles=round(float(reachable_distances.mean()), 2),
+                          p90_distance_miles=round(float(np.percentile(reachable_distances, 90)), 2),
+                          max_distance_miles=round(float(reachable_distances.max()), 2))
+    return statistics
+
+
+def analyze_coverage_for_day(county_grids: typing.Dict[str, CountyGrid], county_points: typing.Dict[str, np.ndarray],
+                             cell_size_meters: float, threshold_miles: float) -> typing.Tuple[dict, list]:
+    # voters can only use the early voting locations of their own county, so distances stay within the county
+    cell_area_square_miles = (cell_size_meters / METERS_PER_MILE) ** 2
+    statistics = {}
+    gaps = []
+    all_distances = []
+    for county, county_grid in county_grids.items():
+        distances_miles = np.full(len(county_grid.x), np.inf)
+        points = county_points.get(county)
+        if points is not None and len(points) > 0 and len(county_grid.x) > 0:
+            tree = shapely.STRtree(shapely.points(points))
+            (cell_indices, _), distances = tree.query_nearest(shapely.points(county_grid.x, county_grid.y),
+                                                              return_distance=True, all_matches=False)
+            distances_miles[cell_indices] = distances / METERS_PER_MILE
+        statistics[county] = summarize_distances(distances_miles, cell_area_square_miles, threshold_miles)
+        if statistics[county]['gap_area_square_miles'] > 0:
+            gap_polygon = get_gap_polygon(county_grid, points, threshold_miles * METERS_PER_MILE)
+            if not gap_polygon.is_empty:
+                gaps.append(dict(county=county, gap_area_square_miles=statistics[county]['gap_area_square_miles'],
+                                 geometry=gap_polygon))
+        all_distances.append(distances_miles)
+    statistics[ALL_LOCATIONS_ID] = summarize_distances(np.concatenate(all_distances), cell_area_square_miles,
+                                                       threshold_miles)
+    return statistics, gaps
+
+
+def get_coverage_directory(output_directory: str) -> str:
+    return os.path.join(output_directory, COVERAGE_DIRECTORY)
+
+
+@lru_cache()
+def get_county_grids(output_directory: str, state: str, cell_size_meters: float) -> typing.Dict[str, CountyGrid]:
+    # county boundaries do not change while a process runs, so a long running watch rasterizes them only once
+    return rasterize_counties(load_county_boundaries(output_directory, state), cell_size_meters)
+
+
+@profiled()
+def export_coverage_analysis(locations, scenarios: dict, output_directory: str, state: str = 'Georgia',
+                             threshold_miles: float = DEFAULT_DISTANCE_THRESHOLD_MILES,
+                             cell_size_miles: float = DEFAULT_CELL_SIZE_MILES,
+                             days: typing.Dict[str, typing.Collection[str]] = None) -> dict:
+    # with days only those scenario days are analyzed again, the summaries of the others are read back from disk
+    from fetch_voting_locations.scenarios import remove_stale_scenario_days
+    cell_size_meters = cell_size_miles * METERS_PER_MILE
+    county_grids = get_county_grids(output_directory, state, cell_size_meters)
+    county_keys = np.asarray(locations['county_key'].to_pylist())
+    lat = locations['lat'].to_numpy()
+    lng = locations['lng'].to_numpy()
+    has_position = np.isfinite(lat) & np.isfinite(lng)
+    projected = gpd.GeoSeries(gpd.points_from_xy(lng, lat), crs='EPSG:4326').to_crs(COVERAGE_CRS)
+    x, y = projected.x.to_numpy(), projected.y.to_numpy()
+    coverage_directory = get_coverage_directory(output_directory)
+    results = {}
+    for scenario_name, scenario in scenarios.items():
+        results[scenario_name] = {}
+        scenario_directory = os.path.join(coverage_directory, scenario_name)
+        for day, open_polls in scenario.get('times', {}).items():
+            day_file = os.path.join(scenario_directory, f'{day}.json')
+            if days is not None and day not in days.get(scenario_name, ()) and os.path.isfile(day_file):
+                previous = load_json_file(day_file)
+                # summaries written before unreachable cells were reported are analyzed again
+                if previous.get('threshold_miles') == threshold_miles and \
+                        previous.get('cell_size_miles') == cell_size_miles and \
+                        'unreachable_cells' in previous['counties'][ALL_LOCATIONS_ID]:
+                    results[scenario_name][day] = previous['counties'][ALL_LOCATIONS_ID]
+                    continue
+            location_ids = np.asarray(open_polls.get(ALL_LOCATIONS_ID, []), dtype=np.int64)
+            location_ids = location_ids[has_position[location_ids]]
+            county_points = {}
+            for county in np.unique(county_keys[location_ids]):
+                county_location_ids = location_ids[county_keys[location_ids] == county]
+                county_points[str(county)] = np.column_stack([x[county_location_ids], y[county_location_ids]])
+            with profile_span('analyze_coverage_for_day', scenario=scenario_name, day=day):
+                statistics, gaps = analyze_coverage_for_day(county_grids, county_points, cell_size_meters,
+                                                            threshold_miles)
+            write_json_file_atomically(day_file, dict(
+                threshold_miles=threshold_miles, cell_size_miles=cell_size_miles, counties=statistics),
+                indent=4, sort_keys=True)
+            gaps_file = os.path.join(scenario_directory, f'{day}_gaps.geojson')
+            if len(gaps) > 0:
+                gaps_gdf = gpd.GeoDataFrame(gaps, geometry='geometry', crs=COVERAGE_CRS).to_crs('EPSG:4326')
+                gaps_gdf.to_file(gaps_file, driver='GeoJSON', COORDINATE_PRECISION=GAP_COORDINATE_PRECISION)
+            elif os.path.isfile(gaps_file):
+                os.remove(gaps_file)
+            results[scenario_name][day] = statistics[ALL_LOCATIONS_ID]
+    remove_stale_scenario_days(coverage_directory, results)
+    write_json_file_atomically(os.path.join(coverage_directory, 'coverage.json'), dict(
+        threshold_miles=threshold_miles, cell_size_miles=cell_size_miles, scenarios=results), indent=4)
+    return results
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import typing
+
+from fetch_voting_locations.geocoding import parse_location_address, get_geocode_comment
+from fetch_voting_locations.location_files import load_counties, load_aggregated_voting_locations
+from fetch_voting_locations.utils.file_cached_function import FileCachedFunction, CacheMissError, \
+    track_cache_keys, is_legacy_key
+from fetch_voting_locations.utils.mapbox_geocode import geocode_address, mapbox_geocode, manually_choose_geocode
+
+
+class CacheReferences(typing.NamedTuple):
+    # current key -> the key its entry is stored under, or None when nothing is cached for it
+    keys: typing.Dict[str, typing.Optional[str]]
+    # stored keys reached by the same lookups made without a county bounding box, as older runs made them
+    unbounded_keys: typing.Set[str]
+
+    def stored_keys(self) -> typing.Set[str]:
+        return {stored_key for stored_key in self.keys.values() if stored_key is not None} | self.unbounded_keys
+
+    def retained_keys(self) -> typing.Set[str]:
+        # the keys left in place once legacy entries are renamed to their current keys
+        return set(self.keys) | self.unbounded_keys
+
+    def legacy_keys(self) -> typing.Dict[str, str]:
+        return {key: stored_key for key, stored_key in self.keys.items()
+                if stored_key is not None and stored_key != key}
+
+
+def get_geocode_caches() -> typing.List[FileCachedFunction]:
+    return [mapbox_geocode, manually_choose_geocode]
+
+
+def find_geocode_cache_references(election_output_directories: typing.List[str]
+                                  ) -> typing.Tuple[typing.Dict[str, CacheReferences], dict]:
+    # replays the lookups geocoding makes for every polling place of the given elections against the caches alone,
+    # so the entries they reach are exactly the ones a fresh run would still use
+    from fetch_voting_locations.geospatial import get_county_bounding_boxes
+    county_bounding_boxes = get_county_bounding_boxes()
+    caches = get_geocode_caches()
+    statistics = dict(locations=0, cached=0, missing=0, unresolved=0)
+    unbounded_keys = [set() for _ in caches]
+    with track_cache_keys(*caches) as tracked_keys:
+        for output_directory in election_output_directories:
+            all_locations = load_aggregated_voting_locations(output_directory)
+            for county in load_counties(output_directory):
+                bounding_box = county_bounding_boxes.get(county.lower())
+                for location in all_locations.get(county) or []:
+                    statistics['locations'] += 1
+                    try:
+                        _, address_query = parse_location_address(location['address'])
+                        geocode_address(address_query, get_geocode_comment(location), interactive=True,
+                                        bounding_box=bounding_box)
+                        statistics['cached'] += 1
+                    except CacheMissError:
+                        statistics['missing'] += 1
+                    except Exception as e:
+                        # the same failure a real run would hit, e.g. MapBox found no match for the address
+                        print(f'Could not resolve {location.get("name")} from the cache: {e}')
+                        statistics['unresolved'] += 1
+                    if bounding_box is not None:
+                        find_unbounded_cache_keys(location, caches, unbounded_keys)
+    return {cache.cache_name: CacheReferences(keys, cache_unbounded_keys)
+            for cache, keys, cache_unbounded_keys in zip(caches, tracked_keys, unbounded_keys)}, statistics
+
+
+def find_unbounded_cache_keys(location: dict, caches: typing.List[FileCachedFunction],
+                              unbounded_keys: typing.List[typing.Set[str]]):
+    # entries stored before county bounding boxes were applied still hold the geocodes the published data came from
+    with track_cache_keys(*caches) as tracked_keys:
+        try:
+            _, address_query = parse_location_address(location['address'])
+            geocode_address(address_query, get_geocode_comment(location), interactive=True)
+        except Exception:
+            pass
+    for cache_unbounded_keys, keys in zip(unbounded_keys, tracked_keys):
+        cache_unbounded_keys.update(stored_key for stored_key in keys.values() if stored_key is not None)
+
+
+def get_file_digest(file_path: str) -> str:
+    with open(file_path, 'rb') as in_file:
+        return hashlib.blake2b(in_file.read(), digest_size=16).hexdigest()
+
+
+def find_duplicate_cache_files(cache_files: typing.Iterable[str]) -> typing.List[typing.List[str]]:
+    files_by_digest = {}
+    for file_path in cache_files:
+        files_by_digest.setdefault(get_file_digest(file_path), []).append(file_path)
+    return [file_paths for file_paths in files_by_digest.values() if len(file_paths) > 1]
+
+
+def get_unlinked_files(file_paths: typing.List[str]) -> typing.List[str]:
+    # the copies not yet hard linked to the first of the files
+    return [file_path for file_path in file_paths[1:] if not os.path.samefile(file_path, file_paths[0])]
+
+
+def get_unreferenced_cache_files(cache: FileCachedFunction, references: CacheReferences) -> typing.Dict[str, str]:
+    referenced_keys = references.stored_keys()
+    return {key: file_path for key, file_path in cache.get_cache_files().items() if key not in referenced_keys}
+
+
+def summarize_cache(cache: FileCachedFunction, references: CacheReferences) -> dict:
+    cache_files = cache.get_cache_files()
+    referenced_keys = references.stored_keys()
+    unreferenced_files = get_unreferenced_cache_files(cache, references)
+    duplicates = find_duplicate_cache_files(path for key, path in cache_files.items() if key in referenced_keys)
+    lookups = len(references.keys)
+    return dict(
+        entries=len(cache_files),
+        size_bytes=sum(os.path.getsize(file_path) for file_path in cache_files.values()),
+        legacy_entries=sum(1 for key in cache_files if is_legacy_key(key)),
+        lookups=lookups,
+        hits=lookups - sum(1 for stored_key in references.keys.values() if stored_key is None),
+        legacy_hits=len(references.legacy_keys()),
+        unbounded_entries=len(references.unbounded_keys.difference(references.keys.values())),
+        unreferenced_entries=len(unreferenced_files),
+        unreferenced_bytes=sum(os.path.getsize(file_path) for file_path in unreferenced_files.values()),
+        duplicate_entries=sum(len(get_unlinked_files(file_paths)) for file_paths in duplicates),
+        duplicate_bytes=sum(os.path.getsize(file_path) for file_paths in duplicates
+                            for file_path in get_unlinked_files(file_paths)),
+    )
+
+
+def compact_cache(cache: FileCachedFunction, references: CacheReferences, prune: bool = True) -> dict:
+    # legacy entries still in use are renamed to their current keys, entries no current election reaches under either
+    # key form are removed and identical responses are hard linked to a single copy
+    cache_files = cache.get_cache_files()
+    migrated = 0
+    for key, legacy_key in references.legacy_keys().items():
+        legacy_file = cache_files.get(legacy_key)
+        if legacy_file is None or not os.path.isfile(legacy_file):
+            continue
+        cache_file = cache._get_cache_file(key)
+        if os.path.isfile(cache_file):
+            os.remove(legacy_file)
+        else:
+            os.replace(legacy_file, cache_file)
+        migrated += 1
+    cache_files = cache.get_cache_files()
+    referenced_keys = references.retained_keys()
+    pruned = 0
+    for key, file_path in cache_files.items():
+        if prune and key not in referenced_keys:
+            os.remove(file_path)
+            pruned += 1
+    linked = 0
+    for file_paths in find_duplicate_cache_files(cache.get_cache_files().values()):
+        for file_path in get_unlinked_files(file_paths):
+            linked_file = f'{file_path}.link'
+            if os.path.exists(linked_file):
+                os.remove(linked_file)
+            os.link(file_paths[0], linked_file)
+            os.replace(linked_file, file_path)
+            linked += 1
+    # forget anything loaded before the files moved
+    cache._cache = {}
+    return dict(migrated=migrated, pruned=pruned, linked=linked)
@@ -0,0 +1,176 @@
+import re
+import time
+import typing
+
+from tqdm import tqdm
+
+from fetch_voting_locations.location_files import ALL_LOCATIONS_ID, load_counties, load_county_voting_locations, \
+    save_county_voting_locations, save_all_county_voting_locations
+from fetch_voting_locations.progress import ProgressManifest, GEOCODED, raise_for_failed_counties
+from fetch_voting_locations.utils.mapbox_geocode import geocode_address, bounding_box_type, AmbiguousGeocodeError
+from fetch_voting_locations.utils.profiling import profile_span, profile_count
+
+
+address_re = re.compile(r'(?P<address_number>[\da-zA-Z]*)\s+(?P<street>[^,]+)((,[^,]+,)|,)\s*(?P<place>[A-Za-z\s.]+)$')
+postcode_re = re.compile(r'\s+(\d+[- ]?\d*)$')
+
+
+def parse_location_address(address: str) -> typing.Tuple[str, typing.Union[str, dict]]:
+    # the normalized address and the MapBox query for it: structured when the street can be parsed, else the address
+    address = address.strip().replace('\n', ', ')
+    postcode = postcode_re.search(address).group(1)
+    assert len(postcode) > 0, f'Failed to parse postcode: {address}'
+    address = address[:-len(postcode)].strip()
+    while address.endswith(','):
+        address = address.rstrip(',')
+    assert str(address).lower().endswith(' ga'), f'Failed to parse state for address: {address}!'
+    region = 'GA'
+    address = address[:-len(region)].strip()
+    while address.endswith(','):
+        address = address.rstrip(',')
+    address_components = address_re.search(address)
+    address += f', {region}, {postcode}'
+    if address_components:
+        address_query = dict(
+            address_number=address_components.group('address_number'),
+            street=address_components.group('street'),
+            place=address_components.group('place'),
+            postcode=postcode,
+            country='United States',
+            region=region
+        )
+    else:
+        address_query = address
+    return address, address_query
+
+
+def get_geocode_comment(location: dict) -> str:
+    # shown when picking between matches, and part of the manual selection cache key
+    return f'Geocoding polling location "{location["name"]}".'
+
+
+def geocode_location(location: dict, bounding_box: bounding_box_type = None, interactive: bool = True):
+    location['address'], address_query = parse_location_address(location['address'])
+    result = geocode_address(address_query, get_geocode_comment(location), interactive=interactive,
+                             bounding_box=bounding_box)
+    if isinstance(result, dict) and result.get('geometry', {}).get('coordinates'):
+        coordinates = result['geometry']['coordinates']
+        location['lng'] = coordinates[0]
+        location['lat'] = coordinates[1]
+
+
+def geocode_locations(locations: typing.List[dict], county_name: str = '', max_attempts: int = 3,
+                      retry_delay: float = 3, interactive: bool = True,
+                      deferred_locations: typing.List[dict] = None) -> bool:
+    # without interactive, locations with several matches are left ungeocoded and added to deferred_locations
+    from fetch_voting_locations.geospatial import get_county_bounding_boxes
+    updated_geocodes = False
+    with profile_span('geocode_locations', county=county_name):
+        county_bounding_box = get_county_bounding_boxes().get(county_name.lower())
+        needs_geocode = list(range(len(locations)))
+        for i in tqdm(needs_geocode, desc=f'Geocoding locations for {county_name}'):
+            location = locations[i]
+            needs_geocode = 'lat' not in location or 'lng' not in location
+            if needs_geocode:
+                profile_count('geocode.locations')
+                for attempt in range(max_attempts):
+                    try:
+                        with profile_span('geocode_location', county=county_name):
+                            geocode_location(location, bounding_box=county_bounding_box, interactive=interactive)
+                        if 'lat' in location and 'lng' in location:
+                            updated_geocodes = True
+                            break
+                    except AmbiguousGeocodeError as e:
+                        print(f'Deferring geocode of {location["name"]}: {e}')
+                        if deferred_locations is not None:
+                            deferred_locations.append(location)
+                        break
+                    except Exception as e:
+                        profile_count('geocode.failures')
+                        print(f'Failed to geocode {location["name"]} due to exception: {e}')
+                    with profile_span('geocode.retry_wait', county=county_name):
+                        time.sleep(retry_delay)
+    return updated_geocodes
+
+
+non_alphanumeric_re = re.compile(r'[^a-z0-9]+')
+
+
+def get_location_identity(location: dict) -> typing.Tuple[str, str]:
+    # scraped addresses are normalized by geocode_location, so compare on alphanumerics only
+    name = non_alphanumeric_re.sub('', str(location.get('name', '')).lower())
+    address = non_alphanumeric_re.sub('', str(location.get('address', '')).lower())
+    return name, address
+
+
+def collect_known_geocodes(all_county_voting_locations: dict, known_geocodes: dict = None) -> dict:
+    if known_geocodes is None:
+        known_geocodes = {}
+    for county, locations in all_county_voting_locations.items():
+        if county == ALL_LOCATIONS_ID:
+            continue
+        for location in locations:
+            if 'lat' in location and 'lng' in location:
+                known_geocodes[get_location_identity(location)] = dict(
+                    address=location['address'], lat=location['lat'], lng=location['lng'])
+    return known_geocodes
+
+
+def apply_known_geocodes(locations: typing.List[dict], known_geocodes: dict) -> bool:
+    reused_geocodes = 0
+    for location in locations:
+        if 'lat' in location and 'lng' in location:
+            continue
+        known_geocode = known_geocodes.get(get_location_identity(location))
+        if known_geocode is not None:
+            location.update(known_geocode)
+            reused_geocodes += 1
+    if reused_geocodes > 0:
+        profile_count('geocode.reused', reused_geocodes)
+        print(f'Reused {reused_geocodes} geocodes from previously processed elections.')
+    return reused_geocodes > 0
+
+
+def geocode_and_save_county(county: str, locations: typing.List[dict], output_directory: str,
+                            known_geocodes: dict = None, manifest: ProgressManifest = None,
+                            interactive: bool = True, deferred_locations: typing.List[dict] = None
+                            ) -> typing.List[dict]:
+    if manifest is not None and manifest.has_reached(county, GEOCODED):
+        return locations
+    try:
+        reused_geocodes = known_geocodes is not None and apply_known_geocodes(locations, known_geocodes)
+        if geocode_locations(locations, county, interactive=interactive,
+                             deferred_locations=deferred_locations) or reused_geocodes:
+            save_county_voting_locations(output_directory, county, locations)
+    except Exception as e:
+        if manifest is not None:
+            manifest.fail(county, 'geocode', e)
+        raise
+    if manifest is not None:
+        missing_geocodes = sum(1 for location in locations if 'lat' not in location or 'lng' not in location)
+        manifest.update(county, GEOCODED, locations=len(locations), missing_geocodes=missing_geocodes)
+    return locations
+
+
+def geocode_county_voting_locations(output_directory: str, counties: typing.List[str] = None,
+                                    known_geocodes: dict = None, resume: bool = False) -> dict:
+    all_counties = load_counties(output_directory)
+    if counties is None:
+        counties = all_counties
+    manifest = ProgressManifest(output_directory, resume)
+    all_locations = {}
+    failed_counties = []
+    for county in counties:
+        locations = load_county_voting_locations(output_directory, county)
+        if locations is None:
+            print(f'No scraped locations found for county {county}; run the scrape stage first.')
+            continue
+        try:
+            all_locations[county] = geocode_and_save_county(county, locations, output_directory, known_geocodes,
+                                                            manifest)
+        except Exception:
+            failed_counties.append(county)
+    raise_for_failed_counties(failed_counties)
+    if all(county in all_locations for county in all_counties):
+        save_all_county_voting_locations(output_directory, all_locations)
+    return all_locations
@@ -0,0 +1,213 @@
+from importlib.resources import files
+from pathlib import Path
+import json
+import os
+import typing
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely import box
+
+from fetch_voting_locations.location_files import ALL_LOCATIONS_ID
+from fetch_voting_locations.utils.profiling import profiled, profile_span
+
+
+@profiled()
+def generate_polling_place_gdf(county_voting_locations: list) -> gpd.GeoDataFrame:
+    data = {}
+    expected_columns = ['address', 'county', 'election', 'lat', 'lng', 'name', 'schedule']
+    for i, location in enumerate(county_voting_locations):
+        data[i] = {
+            k: location.get(k) for k in expected_columns
+        }
+        schedule_line_indices = {}
+        schedule_lines = []
+        for j, line in enumerate(data[i]['schedule']):
+            if schedule_line_indices.get(line) is None:
+                schedule_line_indices[line] = j
+                schedule_lines.append(line)
+        data[i]['schedule'] = '\n'.join(schedule_lines)
+    data = pd.DataFrame.from_dict(data, orient='index')
+    if len(county_voting_locations) > 0:
+        for column in expected_columns:
+            if column not in data:
+                data.loc[:, column] = None
+        data = gpd.GeoDataFrame(data, geometry=gpd.points_from_xy(data.lng, data.lat), crs='EPSG:4326')
+    else:
+        data = gpd.GeoDataFrame()
+    return data
+
+
+@profiled()
+def generate_location_store_gdf(locations) -> gpd.GeoDataFrame:
+    # the store already holds one column per property, so no per-location work is needed
+    from fetch_voting_locations.location_store import LOCATION_COLUMNS
+    if locations.num_rows == 0:
+        return gpd.GeoDataFrame()
+    data = locations.select(LOCATION_COLUMNS).to_pandas()
+    return gpd.GeoDataFrame(data, geometry=gpd.points_from_xy(data.lng, data.lat), crs='EPSG:4326')
+
+
+def write_geojson(locations_gdf: gpd.GeoDataFrame, county: str, output_directory: str):
+    geojson_directory = os.path.join(output_directory, 'geojson')
+    os.makedirs(geojson_directory, exist_ok=True)
+    geojson_file = os.path.join(geojson_directory, f'{county}.geojson')
+    with profile_span('write_geojson', county=county):
+        locations_gdf.to_file(geojson_file, driver='GeoJSON')
+
+
+def write_county_geojson(county_locations: list, county: str, output_directory: str) -> gpd.GeoDataFrame:
+    county_locations_gdf = generate_polling_place_gdf(county_locations)
+    if len(county_locations_gdf) > 0:
+        write_geojson(county_locations_gdf, county, output_directory)
+    return county_locations_gdf
+
+
+def write_all_counties_geojson(location_store, output_directory: str):
+    write_geojson(generate_location_store_gdf(location_store.locations), ALL_LOCATIONS_ID, output_directory)
+
+
+@profiled()
+def export_polling_place_geojson(location_store, counties: typing.List[str], output_directory: str):
+    from fetch_voting_locations.location_store import get_county_row_slices
+    all_locations_gdf = generate_location_store_gdf(location_store.locations)
+    county_rows = get_county_row_slices(location_store.locations)
+    for county in counties:
+        if county in county_rows:
+            write_geojson(all_locations_gdf.iloc[county_rows[county]], county, output_directory)
+    write_geojson(all_locations_gdf, ALL_LOCATIONS_ID, output_directory)
+
+
+@lru_cache()
+def get_state_fips_codes(state_name_column='Name', usps_column='Official USPS Code',
+                         state_fips_column='FIPS State Numeric Code'):
+    # data fetched from https://www.census.gov/library/reference/code-lists/ansi/ansi-codes-for-states.html
+    state_fips_codes = pd.read_csv(Path(str(files("fetch_voting_locations") / 'inputs/states_fips_codes.csv')))
+    for column in [state_name_column, usps_column, state_fips_column]:
+        assert column in state_fips_codes.columns, f'Missing column {column}'
+    state_name_lookup_table = {}
+    usps_lookup_table = {}
+    for _, row in state_fips_codes.iterrows():
+        state_name_lookup_table[row[state_name_column].lower()] = row[state_fips_column]
+        usps_lookup_table[row[usps_column].lower()] = row[state_fips_column]
+    return state_name_lookup_table, usps_lookup_table
+
+
+@lru_cache()
+def get_state_fips(state_name: str = None, state_usps: str = None) -> dict:
+    assert state_name or state_usps, 'State name or USPS code must be specified!'
+    result = None
+    state_name_lookup_table, usps_lookup_table = get_state_fips_codes()
+    if state_name is not None:
+        state_name = state_name.lower()
+        assert state_name in state_name_lookup_table, f'No state could be found with name {state_name}!'
+        result = state_name_lookup_table[state_name]
+    if state_usps is not None:
+        state_usps = state_usps.lower()
+        assert state_usps in usps_lookup_table, f'No state could be found with USPS {state_usps}!'
+        if result is None:
+            result = usps_lookup_table[state_usps]
+        else:
+            assert usps_lookup_table[state_usps] == result, \
+                f'Received conflicting state FIPS codes for name {state_name} and USPS code {state_usps}!'
+    return result
+
+
+@lru_cache()
+def get_state_county_boundaries(state: str = 'Georgia') -> gpd.GeoDataFrame:
+    # data fetched from https://www.census.gov/geographies/mapping-files/time-series/geo/carto-boundary-file.html
+    national_county_boundary_file = Path(str(files("fetch_voting_locations") / 'inputs/cb_2025_us_county_500k.zip'))
+    assert os.path.isfile(national_county_boundary_file), f'Cannot find national county boundary file!: {national_county_boundary_file}'
+    statefp_filter = str(get_state_fips(state_name=state))
+    gdf = gpd.read_file(national_county_boundary_file)
+    gdf = gdf.loc[gdf['STATEFP'] == statefp_filter, ['NAME', 'geometry']]
+    gdf.loc[:, 'name'] = gdf.loc[:, 'NAME']
+    gdf.loc[:, 'NAME'] = gdf.loc[:, 'NAME'].apply(lambda _x: str(_x).upper().replace(' ', ''))
+    state_bounds = gpd.GeoDataFrame(pd.DataFrame(data=[dict(NAME='', geometry=gdf.geometry.union_all())]))
+    gdf = gpd.GeoDataFrame(pd.concat([gdf, state_bounds]))
+    gdf.loc[:, 'lng'] = gdf.geometry.centroid.x
+    gdf.loc[:, 'lat'] = gdf.geometry.centroid.y
+    return gdf
+
+@lru_cache
+def get_county_bounding_boxes(state: str = 'Georgia', lowercase: bool = True) -> dict:
+    state_county_boundaries = get_state_county_boundaries(state)
+    state_bounds = {}
+    for _, row in state_county_boundaries.iterrows():
+        name = row['NAME']
+        if lowercase:
+            name = name.lower()
+        state_bounds[name] = box(*row['geometry'].bounds).bounds
+    return state_bounds
+
+
+@profiled()
+def save_state_county_boundaries(state: str = 'Georgia', output_directory: str = 'data'):
+    county_boundaries_directory = os.path.join(output_directory, 'county_boundaries')
+    os.makedirs(county_boundaries_directory, exist_ok=True)
+    output_file = os.path.join(county_boundaries_directory, f'{state}.geojson')
+    state_counties = get_state_county_boundaries(state)
+    if not os.path.isfile(output_file):
+        state_counties.to_file(output_file)
+    output_file = os.path.join(county_boundaries_directory, f'{state}_bounds.json')
+    if not os.path.isfile(output_file):
+        state_bounding_boxes = state_counties.apply(lambda _x: {_x['NAME']: box(*_x['geometry'].bounds).bounds}, axis=1)
+        state_bounds = {}
+        for bbox in state_bounding_boxes:
+            state_bounds.update(bbox)
+        with open(output_file, 'w') as f:
+            json.dump(state_bounds, f, indent=4)
+    output_file = os.path.join(county_boundaries_directory, f'{state}_centroids.geojson')
+    if not os.path.isfile(output_file):
+        state_counties = state_counties.set_geometry(state_counties.geometry.centroid)
+        state_counties.to_file(output_file)
+
+
+def check_polling_locations_against_boundaries(polling_places: gpd.GeoDataFrame, boundaries: gpd.GeoDataFrame) -> dict:
+    errors = {}
+    counties = list(sorted(polling_places['county'].unique()))
+    for county in counties:
+        points = polling_places.loc[polling_places.county == county]
+        boundary = boundaries.loc[boundaries.NAME == county].union_all()
+        error_points = points.loc[~points.geometry.intersects(boundary)]
+        if len(error_points) > 0:
+            print(f'There are {len(error_points)} points for county {county} that fall outside of the county bounds!')
+            errors[county] = error_points
+    return errors
+
+
+@profiled()
+def spatially_check_polling_places(output_directory: str = 'data', state: str = 'Georgia',
+                                   counties: typing.List[str] = None):
+    # with counties only their polling places are checked again, the errors found earlier for the others are kept
+    import pyarrow as pa
+    from fetch_voting_locations.location_store import get_location_store
+    locations = get_location_store(output_directory).locations
+    if counties is not None:
+        locations = locations.filter(pa.array(np.isin(locations['county_key'].to_pylist(), counties)))
+    all_counties_gdf = generate_location_store_gdf(locations)
+    all_counties_boundaries_gdf = gpd.read_file(os.path.join(output_directory, 'county_boundaries', f'{state}.geojson'))
+    errors = {}
+    if len(all_counties_gdf) > 0:
+        errors = check_polling_locations_against_boundaries(all_counties_gdf, all_counties_boundaries_gdf)
+    errors_file_path = os.path.join(output_directory, f'errors.geojson')
+    if counties is not None and os.path.isfile(errors_file_path):
+        previous_errors = gpd.read_file(errors_file_path)
+        checked_counties = set(locations['county'].to_pylist())
+        for county, county_errors in previous_errors.groupby('county'):
+            if county not in checked_counties:
+                errors[county] = county_errors
+    if len(errors) > 0:
+        all_errors = []
+        for county in sorted(errors.keys()):
+            all_errors.append(errors[county])
+        all_errors = pd.concat(all_errors)
+        all_errors = gpd.GeoDataFrame(all_errors)
+        all_errors.to_file(errors_file_path)
+        print(f'There were {len(all_errors)} polling places which did not intersect with their county bounds!')
+    else:
+        if os.path.isfile(errors_file_path):
+            os.remove(errors_file_path)
+        print('All polling places intersect their county bounds.')
@@ -0,0 +1,86 @@
+import json
+import os
+import typing
+
+from fetch_voting_locations.utils.atomic_files import write_json_file_atomically, write_bytes_file_atomically
+from fetch_voting_locations.utils.profiling import profile_span
+
+ALL_LOCATIONS_ID = 'ALL_COUNTIES'
+
+
+def load_json_file(file_path: str):
+    with open(file_path, 'rt') as in_file:
+        return json.load(in_file)
+
+
+def get_counties_file(output_directory: str) -> str:
+    return os.path.join(output_directory, 'counties.json')
+
+
+def load_counties(output_directory: str) -> typing.List[str]:
+    counties_file = get_counties_file(output_directory)
+    assert os.path.isfile(counties_file), f'No county list found at {counties_file}!'
+    with open(counties_file, 'r') as f:
+        return json.load(f)
+
+
+def discover_election_ids(output_directory: str = 'data') -> typing.List[str]:
+    election_ids = []
+    for election_id in sorted(os.listdir(output_directory)):
+        election_output_directory = os.path.join(output_directory, election_id)
+        if os.path.isfile(get_counties_file(election_output_directory)) or \
+                os.path.isdir(os.path.join(election_output_directory, 'json')):
+            election_ids.append(election_id)
+    return election_ids
+
+
+def get_county_json_file(output_directory: str, county: str) -> str:
+    return os.path.join(output_directory, 'json', f'{county}.json')
+
+
+def load_county_voting_locations(output_directory: str, county: str) -> typing.Optional[typing.List[dict]]:
+    county_file = get_county_json_file(output_directory, county)
+    if os.path.exists(county_file):
+        try:
+            return load_json_file(county_file)
+        except Exception as e:
+            print(f'Failed to load cached locations file for county {county} due to exception: {e}')
+    return None
+
+
+def save_county_voting_locations(output_directory: str, county: str, locations: typing.List[dict]):
+    county_file = get_county_json_file(output_directory, county)
+    with profile_span('write_county_json', county=county):
+        write_json_file_atomically(county_file, locations, indent=4, sort_keys=True)
+
+
+def load_all_county_voting_locations(output_directory: str) -> dict:
+    all_locations = load_county_voting_locations(output_directory, ALL_LOCATIONS_ID)
+    return all_locations if isinstance(all_locations, dict) else {}
+
+
+def save_all_county_voting_locations(output_directory: str, all_locations: dict):
+    save_county_voting_locations(output_directory, ALL_LOCATIONS_ID,
+                                 {k: v for k, v in all_locations.items() if k != ALL_LOCATIONS_ID})
+
+
+def add_all_locations_entry(all_locations: dict, counties: typing.List[str]) -> dict:
+    all_locations_list = []
+    for county in counties:
+        all_locations_list.extend(all_locations[county])
+    all_locations[ALL_LOCATIONS_ID] = all_locations_list
+    return all_locations
+
+
+def load_aggregated_voting_locations(output_directory: str) -> dict:
+    counties = load_counties(output_directory)
+    all_locations = load_all_county_voting_locations(output_directory)
+    all_locations_file = get_county_json_file(output_directory, ALL_LOCATIONS_ID)
+    all_locations_modified = os.path.getmtime(all_locations_file) if len(all_locations) > 0 else 0
+    for county in counties:
+        # counties updated on their own, e.g. geocode --counties, are newer than the statewide file
+        county_file = get_county_json_file(output_directory, county)
+        if county not in all_locations or (os.path.isfile(county_file)
+                                           and os.path.getmtime(county_file) > all_locations_modified):
+            all_locations[county] = load_county_voting_locations(output_directory, county) or []
+    return add_all_locations_entry(all_locations, counties)
@@ -0,0 +1,183 @@
+import datetime
+import os
+import typing
+
+import numpy as np
+
+from fetch_voting_locations.location_files import ALL_LOCATIONS_ID, get_counties_file, get_county_json_file, \
+    load_aggregated_voting_locations, load_counties
+from fetch_voting_locations.scenarios import schedule_regex, parse_date, parse_time
+from fetch_voting_locations.utils.atomic_files import write_file_atomically
+from fetch_voting_locations.utils.profiling import profiled, profile_span
+
+LOCATION_STORE_DIRECTORY = 'store'
+LOCATIONS_FILE = 'locations.arrow'
+SCHEDULE_INTERVALS_FILE = 'schedule_intervals.arrow'
+# the polling place properties exported to GeoJSON, in their exported order
+LOCATION_COLUMNS = ['address', 'county', 'election', 'lat', 'lng', 'name', 'schedule']
+
+
+class LocationStore(typing.NamedTuple):
+    # one row per polling place, ordered by county then by the position within the county's json file
+    locations: 'pyarrow.Table'
+    # one row per schedule line, referencing locations by location_id
+    schedule_intervals: 'pyarrow.Table'
+
+
+def get_location_store_directory(output_directory: str) -> str:
+    return os.path.join(output_directory, LOCATION_STORE_DIRECTORY)
+
+
+def get_minute_of_day(time_value: datetime.time) -> int:
+    return time_value.hour * 60 + time_value.minute
+
+
+@profiled()
+def build_location_store(all_locations: dict, counties: typing.List[str]) -> LocationStore:
+    import pyarrow as pa
+    columns = {column: [] for column in ['location_id', 'county_key', 'county_index'] + LOCATION_COLUMNS}
+    intervals = {column: [] for column in ['location_id', 'start_date', 'end_date', 'start_minute', 'end_minute']}
+    location_id = 0
+    for county in counties:
+        for county_index, location in enumerate(all_locations.get(county) or []):
+            columns['location_id'].append(location_id)
+            columns['county_key'].append(county)
+            columns['county_index'].append(county_index)
+            for column in LOCATION_COLUMNS:
+                if column != 'schedule':
+                    columns[column].append(location.get(column))
+            schedule = location.get('schedule') or []
+            # repeated schedule lines are dropped from the exported text, as the map only needs each span once
+            columns['schedule'].append('\n'.join(dict.fromkeys(schedule)))
+            for line in schedule:
+                interval = schedule_regex.search(line)
+                assert interval is not None, f'Failed to parse schedule "{line}" for location: {location.get("name")}'
+                intervals['location_id'].append(location_id)
+                intervals['start_date'].append(parse_date(interval.group('start')))
+                intervals['end_date'].append(parse_date(interval.group('end')))
+                intervals['start_minute'].append(get_minute_of_day(parse_time(interval.group('start_time'))))
+                intervals['end_minute'].append(get_minute_of_day(parse_time(interval.group('end_time'))))
+            location_id += 1
+    locations = pa.table({
+        'location_id': pa.array(columns['location_id'], pa.int32()),
+        'county_key': pa.array(columns['county_key'], pa.string()).dictionary_encode(),
+        'county_index': pa.array(columns['county_index'], pa.int32()),
+        'address': pa.array(columns['address'], pa.string()),
+        'county': pa.array(columns['county'], pa.string()),
+        'election': pa.array(columns['election'], pa.string()),
+        'lat': pa.array(columns['lat'], pa.float64()),
+        'lng': pa.array(columns['lng'], pa.float64()),
+        'name': pa.array(columns['name'], pa.string()),
+        'schedule': pa.array(columns['schedule'], pa.string()),
+    })
+    schedule_intervals = pa.table({
+        'location_id': pa.array(intervals['location_id'], pa.int32()),
+        'start_date': pa.array(intervals['start_date'], pa.date32()),
+        'end_date': pa.array(intervals['end_date'], pa.date32()),
+        'start_minute': pa.array(intervals['start_minute'], pa.int16()),
+        'end_minute': pa.array(intervals['end_minute'], pa.int16()),
+    })
+    return LocationStore(locations, schedule_intervals)
+
+
+def write_arrow_file_atomically(file_path: str, table):
+    # uncompressed Arrow IPC, so readers can memory map the columns without decoding them
+    import pyarrow as pa
+
+    def write_arrow(temporary_file_path: str):
+        with pa.OSFile(temporary_file_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    write_file_atomically(file_path, write_arrow)
+
+
+def read_arrow_file(file_path: str, columns: typing.List[str] = None):
+    import pyarrow as pa
+    with profile_span('read_location_store', file=os.path.basename(file_path)):
+        table = pa.ipc.open_file(pa.memory_map(file_path, 'r')).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+
+def save_location_store(output_directory: str, location_store: LocationStore):
+    store_directory = get_location_store_directory(output_directory)
+    with profile_span('write_location_store'):
+        write_arrow_file_atomically(os.path.join(store_directory, LOCATIONS_FILE), location_store.locations)
+        write_arrow_file_atomically(os.path.join(store_directory, SCHEDULE_INTERVALS_FILE),
+                                    location_store.schedule_intervals)
+
+
+def load_location_store(output_directory: str, columns: typing.List[str] = None,
+                        interval_columns: typing.List[str] = None) -> LocationStore:
+    store_directory = get_location_store_directory(output_directory)
+    return LocationStore(read_arrow_file(os.path.join(store_directory, LOCATIONS_FILE), columns),
+                         read_arrow_file(os.path.join(store_directory, SCHEDULE_INTERVALS_FILE), interval_columns))
+
+
+def is_location_store_stale(output_directory: str) -> bool:
+    store_files = [os.path.join(get_location_store_directory(output_directory), file_name)
+                   for file_name in [LOCATIONS_FILE, SCHEDULE_INTERVALS_FILE]]
+    if not all(os.path.isfile(store_file) for store_file in store_files):
+        return True
+    store_modified = min(os.path.getmtime(store_file) for store_file in store_files)
+    counties_file = get_counties_file(output_directory)
+    source_files = [counties_file, get_county_json_file(output_directory, ALL_LOCATIONS_ID)]
+    if os.path.isfile(counties_file):
+        source_files.extend(get_county_json_file(output_directory, county)
+                            for county in load_counties(output_directory))
+    return any(os.path.getmtime(source_file) > store_modified for source_file in source_files
+               if os.path.isfile(source_file))
+
+
+def update_location_store(output_directory: str, all_locations: dict, counties: typing.List[str]) -> LocationStore:
+    location_store = build_location_store(all_locations, counties)
+    save_location_store(output_directory, location_store)
+    return location_store
+
+
+def get_location_store(output_directory: str, columns: typing.List[str] = None,
+                       interval_columns: typing.List[str] = None) -> LocationStore:
+    if is_location_store_stale(output_directory):
+        print(f'Building location store for {output_directory} from the county json files.')
+        update_location_store(output_directory, load_aggregated_voting_locations(output_directory),
+                              load_counties(output_directory))
+    return load_location_store(output_directory, columns, interval_columns)
+
+
+def find_open_location_ids(schedule_intervals, day: datetime.date,
+                           time_filter: datetime.time = None) -> np.ndarray:
+    # dates are compared as days since the epoch, the same representation date32 columns store
+    day_number = (day - datetime.date(1970, 1, 1)).days
+    is_open = ((schedule_intervals['start_date'].combine_chunks().cast('int32').to_numpy() <= day_number)
+               & (day_number <= schedule_intervals['end_date'].combine_chunks().cast('int32').to_numpy()))
+    if time_filter is not None:
+        minute = get_minute_of_day(time_filter)
+        is_open &= ((schedule_intervals['start_minute'].to_numpy() <= minute)
+                    & (minute <= schedule_intervals['end_minute'].to_numpy()))
+    return np.unique(schedule_intervals['location_id'].to_numpy()[is_open])
+
+
+def get_county_row_slices(locations) -> dict:
+    county_keys = locations['county_key'].combine_chunks()
+    county_codes = county_keys.indices.to_numpy()
+    run_starts = np.flatnonzero(np.diff(county_codes, prepend=-1))
+    run_ends = np.append(run_starts[1:], len(county_codes))
+    return {county_keys.dictionary[county_codes[run_start]].as_py(): slice(int(run_start), int(run_end))
+            for run_start, run_end in zip(run_starts, run_ends)}
+
+
+def group_location_ids_by_county(locations, location_ids: np.ndarray) -> dict:
+    # location ids follow county order, so each county's open locations form one contiguous run
+    results = {}
+    county_keys = locations['county_key'].combine_chunks()
+    county_codes = county_keys.indices.to_numpy()[location_ids]
+    county_indices = locations['county_index'].to_numpy()[location_ids]
+    run_starts = np.flatnonzero(np.diff(county_codes, prepend=-1))
+    run_ends = np.append(run_starts[1:], len(county_codes))
+    for run_start, run_end in zip(run_starts, run_ends):
+        county = county_keys.dictionary[county_codes[run_start]].as_py()
+        results[county] = county_indices[run_start:run_end].tolist()
+    if len(location_ids) > 0:
+        results[ALL_LOCATIONS_ID] = location_ids.tolist()
+    return results
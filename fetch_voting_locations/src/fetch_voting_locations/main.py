@@ -1,21 +1,434 @@
+import os
+import typing
+
 import typer
-from fetch_voting_locations.fetch_early_voting_locations import fetch_early_voting_locations, main
+from fetch_voting_locations.utils.profiling import profiling_session
 
+# commands import their stage modules lazily so that quick commands do not pay for selenium or the geospatial stack
 app = typer.Typer()
 
+profile_option = typer.Option(False, help="Record timing spans and counters for this run")
+profile_report_file_option = typer.Option('profile_report.json',
+                                          help="Where to write the JSON timing report when profiling")
+chrome_trace_file_option = typer.Option('', help="Optionally also write a Chrome trace (chrome://tracing)")
+nearest_option = typer.Option(False, help="Also export the nearest open polling place lookup grid")
+clusters_option = typer.Option(False, help="Also export precomputed map marker clusters")
+coverage_option = typer.Option(False, help="Also analyze how much of each county is near an open polling place")
+
 
 @app.command()
 def fetch(election_id: str = typer.Argument('a0pcs00000J6e6HAAR', help="The election ID"),
           scenarios_file_path: str = '../scenarios.json',
           state='Georgia',
-          output_directory: str = '../data'
+          output_directory: str = '../data',
+          pipelined: bool = typer.Option(False, help="Overlap scraping, geocoding and export across counties"),
+          queue_size: int = typer.Option(2, help="Counties allowed to wait between pipelined stages"),
+          resume: bool = typer.Option(False, help="Skip counties the progress manifest records as finished"),
+          publish: bool = typer.Option(True, help="Publish minified, compressed and content hashed outputs"),
+          nearest: bool = nearest_option,
+          clusters: bool = clusters_option,
+          coverage: bool = coverage_option,
+          profile: bool = profile_option,
+          profile_report_file: str = profile_report_file_option,
+          chrome_trace_file: str = chrome_trace_file_option
           ):
     """
     Fetch early voting locations for a specific election
     """
+    from fetch_voting_locations.fetch_early_voting_locations import main
     print(f'Fetching early voting locations for election {election_id}...')
+    with profiling_session(profile, profile_report_file, chrome_trace_file):
+        main(election_id=election_id, scenarios_file_path=scenarios_file_path, state=state,
+             output_directory=output_directory, pipelined=pipelined, queue_size=queue_size, resume=resume,
+             publish_outputs=publish, nearest_outputs=nearest, cluster_outputs=clusters, coverage_outputs=coverage)
+
+
+@app.command()
+def fetch_all(election_ids: typing.Optional[typing.List[str]] = typer.Argument(
+                  None, help="The election IDs; defaults to every election already in the output directory"),
+              scenarios_file_path: str = typer.Option('../scenarios.json',
+                                                      help="May contain {election_id} for per election scenarios"),
+              state='Georgia',
+              output_directory: str = '../data',
+              pipelined: bool = typer.Option(False, help="Overlap scraping, geocoding and export across counties"),
+              queue_size: int = typer.Option(2, help="Counties allowed to wait between pipelined stages"),
+              resume: bool = typer.Option(False, help="Skip counties the progress manifest records as finished"),
+              publish: bool = typer.Option(True, help="Publish minified, compressed and content hashed outputs"),
+              nearest: bool = nearest_option,
+              clusters: bool = clusters_option,
+              coverage: bool = coverage_option,
+              profile: bool = profile_option,
+              profile_report_file: str = profile_report_file_option,
+              chrome_trace_file: str = chrome_trace_file_option
+              ):
+    """
+    Fetch early voting locations for several elections in one run, sharing the browser and caches
+    """
+    from fetch_voting_locations.fetch_early_voting_locations import main_batch
+    with profiling_session(profile, profile_report_file, chrome_trace_file):
+        main_batch(election_ids=election_ids, scenarios_file_path=scenarios_file_path, state=state,
+                   output_directory=output_directory, pipelined=pipelined, queue_size=queue_size,
+                   resume=resume, publish_outputs=publish, nearest_outputs=nearest, cluster_outputs=clusters,
+                   coverage_outputs=coverage)
+
+
+@app.command()
+def scrape(election_id: str = typer.Argument('a0pcs00000J6e6HAAR', help="The election ID"),
+           output_directory: str = '../data',
+           counties: typing.Optional[typing.List[str]] = typer.Option(None, help="Only scrape these counties"),
+           resume: bool = typer.Option(False, help="Skip counties the progress manifest records as scraped")
+           ):
+    """
+    Scrape polling places for each county that has not been scraped yet
+    """
+    from fetch_voting_locations.scrape import scrape_county_voting_locations
+    scrape_county_voting_locations(election_id, os.path.join(output_directory, election_id), counties or None,
+                                   resume=resume)
+
+
+@app.command()
+def geocode(election_id: str = typer.Argument('a0pcs00000J6e6HAAR', help="The election ID"),
+            output_directory: str = '../data',
+            counties: typing.Optional[typing.List[str]] = typer.Option(None, help="Only geocode these counties"),
+            resume: bool = typer.Option(False, help="Skip counties the progress manifest records as geocoded")
+            ):
+    """
+    Geocode scraped polling places which are missing coordinates
+    """
+    from fetch_voting_locations.geocoding import geocode_county_voting_locations
+    geocode_county_voting_locations(os.path.join(output_directory, election_id), counties or None, resume=resume)
+
+
+@app.command()
+def export(election_id: str = typer.Argument('a0pcs00000J6e6HAAR', help="The election ID"),
+           output_directory: str = '../data'
+           ):
+    """
+    Write the county and statewide GeoJSON files from the geocoded polling places
+    """
+    from fetch_voting_locations.geospatial import export_polling_place_geojson
+    from fetch_voting_locations.location_files import load_counties
+    from fetch_voting_locations.location_store import get_location_store
+    election_output_directory = os.path.join(output_directory, election_id)
+    export_polling_place_geojson(get_location_store(election_output_directory),
+                                 load_counties(election_output_directory), election_output_directory)
+
+
+@app.command()
+def build_store(election_id: str = typer.Argument('a0pcs00000J6e6HAAR', help="The election ID"),
+                output_directory: str = '../data'
+                ):
+    """
+    Rebuild the columnar location store from the county json files
+    """
+    from fetch_voting_locations.location_files import load_aggregated_voting_locations, load_counties
+    from fetch_voting_locations.location_store import update_location_store
+    election_output_directory = os.path.join(output_directory, election_id)
+    location_store = update_location_store(election_output_directory,
+                                           load_aggregated_voting_locations(election_output_directory),
+                                           load_counties(election_output_directory))
+    print(f'Stored {location_store.locations.num_rows} polling places and '
+          f'{location_store.schedule_intervals.num_rows} schedule intervals.')
+
+
+@app.command()
+def build_scenarios(election_id: str = typer.Argument('a0pcs00000J6e6HAAR', help="The election ID"),
+                    scenarios_file_path: str = '../scenarios.json',
+                    output_directory: str = '../data'
+                    ):
+    """
+    Regenerate the scenario subsets from the already fetched polling places
+    """
+    import json
+    from fetch_voting_locations.location_store import get_location_store
+    from fetch_voting_locations.scenarios import generate_voting_location_subsets
+    election_output_directory = os.path.join(output_directory, election_id)
+    with open(scenarios_file_path, 'rt') as in_file:
+        scenarios = json.load(in_file)
+    location_store = get_location_store(election_output_directory, columns=['county_key', 'county_index'])
+    generate_voting_location_subsets(location_store, scenarios,
+                                     output_directory=os.path.join(election_output_directory, 'scenarios'))
+
+
+@app.command()
+def build_nearest(election_id: str = typer.Argument('a0pcs00000J6e6HAAR', help="The election ID"),
+                  output_directory: str = '../data',
+                  cell_size_degrees: float = typer.Option(0.05, help="Grid cell size of the precomputed candidates"),
+                  k: int = typer.Option(3, help="Nearest open polling places each cell must answer")
+                  ):
+    """
+    Precompute the nearest open polling place candidates for every scenario day
+    """
+    from fetch_voting_locations.nearest import load_nearest_open_location_index, export_nearest_open_locations
+    election_output_directory = os.path.join(output_directory, election_id)
+    export_nearest_open_locations(load_nearest_open_location_index(election_output_directory),
+                                  election_output_directory, cell_size_degrees=cell_size_degrees, k=k)
+
+
+@app.command()
+def build_clusters(election_id: str = typer.Argument('a0pcs00000J6e6HAAR', help="The election ID"),
+                   output_directory: str = '../data',
+                   min_zoom: int = 7,
+                   max_zoom: int = 18
+                   ):
+    """
+    Precompute the polling place marker clusters of every scenario day for each map zoom level
+    """
+    from fetch_voting_locations.clusters import export_marker_clusters, CLUSTER_LOCATION_COLUMNS
+    from fetch_voting_locations.location_files import load_json_file
+    from fetch_voting_locations.location_store import get_location_store
+    election_output_directory = os.path.join(output_directory, election_id)
+    export_marker_clusters(get_location_store(election_output_directory, columns=CLUSTER_LOCATION_COLUMNS).locations,
+                           load_json_file(os.path.join(election_output_directory, 'scenarios', 'scenarios.json')),
+                           election_output_directory, min_zoom=min_zoom, max_zoom=max_zoom)
+
+
+@app.command()
+def nearest(day: str = typer.Argument(..., help="The scenario day, e.g. 2026-05-19"),
+            lat: float = typer.Option(..., help="Latitude to search from"),
+            lng: float = typer.Option(..., help="Longitude to search from"),
+            election_id: str = 'a0pcs00000J6e6HAAR',
+            scenario: str = 'any_time',
+            k: int = 3,
+            output_directory: str = '../data'
+            ):
+    """
+    Print the nearest polling places open during a scenario day
+    """
+    from fetch_voting_locations.nearest import load_nearest_open_location_index
+    index = load_nearest_open_location_index(os.path.join(output_directory, election_id))
+    try:
+        locations = index.query(lat, lng, scenario, day, k)
+    except ValueError as e:
+        print(e)
+        raise typer.Exit(code=1)
+    for location in locations:
+        print(f'{location["distance_km"]:8.3f} km  {location["name"]} ({location["county"]}): {location["address"]}')
+
+
+@app.command()
+def nearest_server(election_id: str = typer.Argument('a0pcs00000J6e6HAAR', help="The election ID"),
+                   output_directory: str = '../data',
+                   port: int = 8766
+                   ):
+    """
+    Serve nearest open polling place queries at /nearest?lat=&lng=&day=&scenario=&k=
+    """
+    from fetch_voting_locations.nearest import load_nearest_open_location_index, NearestServer
+    server = NearestServer(load_nearest_open_location_index(os.path.join(output_directory, election_id)),
+                           port=port, verbose=True)
+    print(f'Nearest open polling places: {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+@app.command()
+def coverage(election_id: str = typer.Argument('a0pcs00000J6e6HAAR', help="The election ID"),
+             output_directory: str = '../data',
+             state='Georgia',
+             threshold_miles: float = typer.Option(10.0, help="Distance beyond which a place counts as a gap"),
+             cell_size_miles: float = typer.Option(0.5, help="Grid cell size used to rasterize the counties")
+             ):
+    """
+    Measure how much of each county is within reach of an open polling place for every scenario day
+    """
+    from fetch_voting_locations.coverage import export_coverage_analysis, COVERAGE_LOCATION_COLUMNS
+    from fetch_voting_locations.location_files import load_json_file
+    from fetch_voting_locations.location_store import get_location_store
+    election_output_directory = os.path.join(output_directory, election_id)
+    results = export_coverage_analysis(
+        get_location_store(election_output_directory, columns=COVERAGE_LOCATION_COLUMNS).locations,
+        load_json_file(os.path.join(election_output_directory, 'scenarios', 'scenarios.json')),
+        election_output_directory, state=state, threshold_miles=threshold_miles, cell_size_miles=cell_size_miles)
+    for scenario_name, days in results.items():
+        for day, statistics in days.items():
+            print(f'{scenario_name} {day}: {statistics["covered_fraction"]:.1%} of {state} within '
+                  f'{threshold_miles} miles, {statistics["gap_area_square_miles"]} square miles uncovered, '
+                  f'{statistics["unreachable_area_square_miles"]} square miles without an open location')
+
+
+@app.command()
+def publish(election_ids: typing.Optional[typing.List[str]] = typer.Argument(
+                None, help="The election IDs; defaults to every election already in the output directory"),
+            output_directory: str = '../data',
+            brotli: bool = typer.Option(True, help="Also write brotli variants when brotli is installed"),
+            include: typing.Optional[typing.List[str]] = typer.Option(
+                None, help="Also publish outputs matching this glob, e.g. 'nearest/**/*.json'")
+            ):
+    """
+    Publish minified, precompressed and content hashed copies of the site data
+    """
+    from fetch_voting_locations.location_files import discover_election_ids
+    from fetch_voting_locations.publish import publish as publish_elections, PUBLISHED_PATTERNS
+    election_ids = election_ids or discover_election_ids(output_directory)
+    publish_elections([os.path.join(output_directory, election_id) for election_id in election_ids],
+                      output_directory, brotli=brotli,
+                      patterns=PUBLISHED_PATTERNS + list(include or []))
+
+
+@app.command()
+def watch(election_id: str = typer.Argument('a0pcs00000J6e6HAAR', help="The election ID"),
+          scenarios_file_path: str = '../scenarios.json',
+          state='Georgia',
+          output_directory: str = '../data',
+          interval_minutes: float = typer.Option(
+              60, help="How often an average county is re-scraped; large and recently changed ones more often"),
+          max_counties: int = typer.Option(20, help="Most counties re-scraped in one cycle"),
+          port: int = typer.Option(8767, help="Local port serving /health and /metrics"),
+          publish: bool = typer.Option(True, help="Publish minified, compressed and content hashed outputs"),
+          nearest: bool = nearest_option,
+          clusters: bool = clusters_option,
+          coverage: bool = coverage_option,
+          cycles: int = typer.Option(0, help="Stop after this many cycles; 0 watches until interrupted")
+          ):
+    """
+    Keep re-scraping counties on a schedule and rebuild only the outputs their changes affect
+    """
+    from fetch_voting_locations.fetch_early_voting_locations import main
+    from fetch_voting_locations.watch import ElectionWatcher, WatchServer
+    # one full run first, so every output exists and the browser, boundaries and caches are warm
     main(election_id=election_id, scenarios_file_path=scenarios_file_path, state=state,
-         output_directory=output_directory)
+         output_directory=output_directory, publish_outputs=publish, nearest_outputs=nearest,
+         cluster_outputs=clusters, coverage_outputs=coverage)
+    watcher = ElectionWatcher(election_id, scenarios_file_path, state=state, output_directory=output_directory,
+                              interval_minutes=interval_minutes, max_counties_per_cycle=max_counties,
+                              publish_outputs=publish, nearest_outputs=nearest, cluster_outputs=clusters,
+                              coverage_outputs=coverage)
+    server = WatchServer(watcher.status, port=port).start()
+    print(f'Watching election {election_id}; health: {server.url}/health, metrics: {server.url}/metrics')
+    try:
+        watcher.run(cycles)
+    except KeyboardInterrupt:
+        watcher.stop()
+    finally:
+        server.stop()
+
+
+@app.command()
+def cache(election_ids: typing.Optional[typing.List[str]] = typer.Argument(
+              None, help="The election IDs whose polling places are kept; defaults to every election found"),
+          output_directory: str = '../data',
+          apply: bool = typer.Option(False, help="Migrate, prune and deduplicate; otherwise only report"),
+          force: bool = typer.Option(False, help="Prune even when some polling places are not cached")
+          ):
+    """
+    Report geocode cache statistics, and with --apply migrate legacy keys, prune unreferenced and link duplicates
+    """
+    from fetch_voting_locations.location_files import discover_election_ids
+    from fetch_voting_locations.geocode_cache import find_geocode_cache_references, get_geocode_caches, \
+        summarize_cache, compact_cache, get_unreferenced_cache_files
+    election_ids = election_ids or discover_election_ids(output_directory)
+    references, statistics = find_geocode_cache_references(
+        [os.path.join(output_directory, election_id) for election_id in election_ids])
+    print(f'{statistics["locations"]} polling places in {len(election_ids)} elections: {statistics["cached"]} '
+          f'resolved from the cache, {statistics["missing"]} not cached, {statistics["unresolved"]} unresolved.')
+    for geocode_cache in get_geocode_caches():
+        summary = summarize_cache(geocode_cache, references[geocode_cache.cache_name])
+        print(f'{geocode_cache.cache_name}: {summary["entries"]} entries ({summary["size_bytes"] / 1e6:.1f} MB), '
+              f'{summary["legacy_entries"]} with legacy keys; {summary["hits"]} of {summary["lookups"]} lookups hit '
+              f'({summary["legacy_hits"]} through legacy keys); {summary["unbounded_entries"]} kept for lookups '
+              f'without a county bounding box; {summary["unreferenced_entries"]} unreferenced '
+              f'({summary["unreferenced_bytes"] / 1e6:.1f} MB); {summary["duplicate_entries"]} duplicates '
+              f'({summary["duplicate_bytes"] / 1e6:.1f} MB)')
+    if not apply:
+        for geocode_cache in get_geocode_caches():
+            for file_path in get_unreferenced_cache_files(geocode_cache, references[geocode_cache.cache_name]).values():
+                print(f'Would delete {file_path}')
+        print('Dry run; re-run with --apply to compact the caches.')
+        return
+    # a polling place that is not cached usually means its entry is stored under a key the replay does not
+    # reproduce, not that the entry is stale, so pruning would throw away geocodes that were paid for
+    prune = force or statistics['missing'] == 0
+    if not prune:
+        print(f'{statistics["missing"]} polling places are not cached; not pruning the caches. '
+              f'Re-run with --force to prune anyway.')
+    assert statistics['cached'] > 0, 'No polling place resolved from the cache; refusing to compact it.'
+    for geocode_cache in get_geocode_caches():
+        result = compact_cache(geocode_cache, references[geocode_cache.cache_name], prune=prune)
+        print(f'{geocode_cache.cache_name}: migrated {result["migrated"]} legacy keys, pruned {result["pruned"]} '
+              f'entries, linked {result["linked"]} duplicates.')
+
+
+@app.command()
+def validate(election_id: str = typer.Argument('a0pcs00000J6e6HAAR', help="The election ID"),
+             state='Georgia',
+             output_directory: str = '../data'
+             ):
+    """
+    Save the county boundaries and check every polling place falls inside its county
+    """
+    from fetch_voting_locations.geospatial import save_state_county_boundaries, spatially_check_polling_places
+    election_output_directory = os.path.join(output_directory, election_id)
+    save_state_county_boundaries(output_directory=election_output_directory, state=state)
+    spatially_check_polling_places(output_directory=election_output_directory, state=state)
+
+
+@app.command()
+def benchmark(baseline_file: str = typer.Option('benchmark_baseline.json', help="Stored baseline timings"),
+              update_baseline: bool = typer.Option(False, help="Overwrite the baseline with this run's timings"),
+              tolerance: float = typer.Option(0.25, help="Allowed slowdown against the baseline before failing"),
+              counties: int = 159,
+              locations_per_county: int = 20,
+              schedule_lines: int = 6,
+              scenario_days: int = 19,
+              cache_entries: int = 500,
+              repeat: int = 3
+              ):
+    """
+    Time the offline pipeline stages against a synthetic statewide dataset
+    """
+    from fetch_voting_locations.benchmark import main as benchmark_main
+    regressions = benchmark_main(baseline_file=baseline_file, update_baseline=update_baseline, tolerance=tolerance,
+                                 counties=counties, locations_per_county=locations_per_county,
+                                 schedule_lines=schedule_lines, scenario_days=scenario_days,
+                                 cache_entries=cache_entries, repeat=repeat)
+    if len(regressions) > 0:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def replay_server(fixture_directory: str = typer.Option('replay_fixtures', help="Recorded fixtures to serve"),
+                  election_directory: str = typer.Option('', help="Write SOS fixture pages from this election first"),
+                  port: int = 8765,
+                  geocode_latency_seconds: float = 0.0,
+                  page_latency_seconds: float = 0.0,
+                  record_url: str = typer.Option('', help="Record unseen MapBox requests from this upstream URL")
+                  ):
+    """
+    Serve recorded MapBox responses and SOS result pages locally
+    """
+    from fetch_voting_locations.utils.replay import ReplayServer, write_sos_fixtures_for_election
+    if election_directory:
+        write_sos_fixtures_for_election(election_directory, fixture_directory)
+    server = ReplayServer(fixture_directory, port=port, geocode_latency_seconds=geocode_latency_seconds,
+                          page_latency_seconds=page_latency_seconds, record_url=record_url or None, verbose=True)
+    print(f'MapBox forward geocoding: {server.mapbox_forward_url}')
+    print(f'SOS polling places: {server.sos_locations_url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+@app.command()
+def replay_benchmark(election_directory: str = typer.Argument('../data/a0pcs00000J6e6HAAR',
+                                                              help="Election data to build fixtures from"),
+                     fixture_directory: str = 'replay_fixtures',
+                     geocode_latency_seconds: float = 0.05,
+                     page_latency_seconds: float = 0.5,
+                     scrape: bool = typer.Option(False, help="Also scrape the fixture pages with the browser"),
+                     scrape_files: bool = typer.Option(False, help="Load the fixture pages from file:// URLs"),
+                     state='Georgia'
+                     ):
+    """
+    Measure scraping and geocoding throughput against the local replay server
+    """
+    from fetch_voting_locations.benchmark import run_replay_benchmarks
+    run_replay_benchmarks(election_directory, fixture_directory, geocode_latency_seconds=geocode_latency_seconds,
+                          page_latency_seconds=page_latency_seconds, scrape=scrape, state=state,
+                          scrape_files=scrape_files)
 
 
 if __name__ == '__main__':
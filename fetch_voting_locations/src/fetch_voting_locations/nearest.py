@@ -0,0 +1,229 @@
+import json
+import os
+import typing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from fetch_voting_locations.location_files import ALL_LOCATIONS_ID, load_json_file, write_json_file_atomically
+from fetch_voting_locations.utils.profiling import profiled, profile_span
+
+EARTH_RADIUS_KM = 6371.0088
+NEAREST_DIRECTORY = 'nearest'
+NEAREST_PATH = '/nearest'
+# roughly 5km cells over Georgia, small enough that each cell only keeps a handful of candidates
+DEFAULT_CELL_SIZE_DEGREES = 0.05
+DEFAULT_NEAREST_COUNT = 3
+NEAREST_LOCATION_COLUMNS = ['location_id', 'county_key', 'county_index', 'name', 'address', 'lat', 'lng']
+
+
+def to_unit_vectors(lat, lng) -> np.ndarray:
+    # points on the unit sphere, so euclidean distances order the same way as great circle distances
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lng = np.radians(np.asarray(lng, dtype=float))
+    return np.stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(chord_distance):
+    return 2 * np.arcsin(np.minimum(np.asarray(chord_distance) / 2, 1.0)) * EARTH_RADIUS_KM
+
+
+class NearestOpenLocationIndex:
+    def __init__(self, locations, scenarios: dict):
+        from scipy.spatial import cKDTree
+        self._cKDTree = cKDTree
+        # plain lists, so building an answer does no per-row pandas work
+        self.locations = {column: locations[column].to_pylist() for column in NEAREST_LOCATION_COLUMNS}
+        self.locations['county'] = self.locations.pop('county_key')
+        self.scenarios = scenarios
+        self.vectors = to_unit_vectors(locations['lat'].to_numpy(), locations['lng'].to_numpy())
+        self.has_position = np.isfinite(self.vectors).all(axis=1)
+        self._trees = {}
+
+    def get_open_location_ids(self, scenario: str, day: str) -> np.ndarray:
+        open_polls = self.scenarios.get(scenario, {}).get('times', {}).get(day, {})
+        location_ids = np.asarray(open_polls.get(ALL_LOCATIONS_ID, []), dtype=np.int64)
+        return location_ids[self.has_position[location_ids]]
+
+    def get_tree(self, scenario: str, day: str):
+        key = (scenario, day)
+        if key not in self._trees:
+            location_ids = self.get_open_location_ids(scenario, day)
+            tree = self._cKDTree(self.vectors[location_ids]) if len(location_ids) > 0 else None
+            self._trees[key] = (tree, location_ids)
+        return self._trees[key]
+
+    def query(self, lat: float, lng: float, scenario: str, day: str,
+              k: int = DEFAULT_NEAREST_COUNT) -> typing.List[dict]:
+        if k < 1:
+            raise ValueError(f'Expected k to be at least 1, got {k}')
+        if not (np.isfinite(lat) and -90 <= lat <= 90 and np.isfinite(lng) and -180 <= lng <= 180):
+            raise ValueError(f'Expected a latitude within [-90, 90] and a longitude within [-180, 180], '
+                             f'got {lat}, {lng}')
+        tree, location_ids = self.get_tree(scenario, day)
+        if tree is None:
+            return []
+        k = min(k, len(location_ids))
+        distances, indices = tree.query(to_unit_vectors(lat, lng), k=k)
+        results = []
+        for distance, index in zip(np.atleast_1d(distances).tolist(), np.atleast_1d(indices).tolist()):
+            location_id = int(location_ids[index])
+            results.append(dict(
+                location_id=location_id,
+                county=self.locations['county'][location_id],
+                county_index=self.locations['county_index'][location_id],
+                name=self.locations['name'][location_id],
+                address=self.locations['address'][location_id],
+                lat=self.locations['lat'][location_id],
+                lng=self.locations['lng'][location_id],
+                distance_km=round(float(chord_to_km(distance)), 3),
+            ))
+        return results
+
+    def get_grid(self, cell_size_degrees: float = DEFAULT_CELL_SIZE_DEGREES) -> dict:
+        lat = np.asarray(self.locations['lat'], dtype=float)[self.has_position]
+        lng = np.asarray(self.locations['lng'], dtype=float)[self.has_position]
+        if len(lat) == 0:
+            # nothing is geocoded yet, so there is no area to cover
+            return dict(west=0.0, south=0.0, cell_size_degrees=cell_size_degrees, columns=0, rows=0)
+        west = np.floor(lng.min() / cell_size_degrees) * cell_size_degrees - cell_size_degrees
+        south = np.floor(lat.min() / cell_size_degrees) * cell_size_degrees - cell_size_degrees
+        columns = int(np.ceil((lng.max() - west) / cell_size_degrees)) + 1
+        rows = int(np.ceil((lat.max() - south) / cell_size_degrees)) + 1
+        return dict(west=round(float(west), 6), south=round(float(south), 6), cell_size_degrees=cell_size_degrees,
+                    columns=columns, rows=rows)
+
+    def get_cell_candidates(self, scenario: str, day: str, grid: dict,
+                            k: int = DEFAULT_NEAREST_COUNT) -> typing.Optional[dict]:
+        # any point in a cell has its k nearest open locations within the k-th nearest distance from the cell
+        # center plus twice the center-to-corner distance, so those candidates answer every query in the cell
+        tree, location_ids = self.get_tree(scenario, day)
+        if tree is None:
+            return None
+        k = min(k, len(location_ids))
+        cell_size = grid['cell_size_degrees']
+        column_centers = grid['west'] + (np.arange(grid['columns']) + 0.5) * cell_size
+        row_centers = grid['south'] + (np.arange(grid['rows']) + 0.5) * cell_size
+        center_lng, center_lat = np.meshgrid(column_centers, row_centers)
+        centers = to_unit_vectors(center_lat.ravel(), center_lng.ravel())
+        corner_distances = [
+            np.linalg.norm(centers - to_unit_vectors(center_lat.ravel() + lat_offset, center_lng.ravel() + lng_offset),
+                           axis=1)
+            for lat_offset in (-cell_size / 2, cell_size / 2) for lng_offset in (-cell_size / 2, cell_size / 2)]
+        cell_radius = np.max(corner_distances, axis=0)
+        distances, _ = tree.query(centers, k=k)
+        kth_distance = distances if k == 1 else distances[:, -1]
+        candidate_lists = tree.query_ball_point(centers, kth_distance + 2 * cell_radius * (1 + 1e-9))
+        candidates = []
+        candidate_lookup = {}
+        cells = []
+        for candidate_list in candidate_lists:
+            candidate_key = tuple(sorted(int(location_ids[i]) for i in candidate_list))
+            if candidate_key not in candidate_lookup:
+                candidate_lookup[candidate_key] = len(candidates)
+                candidates.append(list(candidate_key))
+            cells.append(candidate_lookup[candidate_key])
+        # cells are listed row by row from the south west corner, each pointing at a shared candidate list
+        return dict(k=k, grid=grid, candidates=candidates, cells=cells)
+
+
+def get_nearest_directory(output_directory: str) -> str:
+    return os.path.join(output_directory, NEAREST_DIRECTORY)
+
+
+def load_nearest_open_location_index(output_directory: str) -> NearestOpenLocationIndex:
+    from fetch_voting_locations.location_store import get_location_store
+    scenarios_file = os.path.join(output_directory, 'scenarios', 'scenarios.json')
+    assert os.path.isfile(scenarios_file), f'No scenarios found at {scenarios_file}; run build-scenarios first.'
+    return NearestOpenLocationIndex(get_location_store(output_directory, columns=NEAREST_LOCATION_COLUMNS).locations,
+                                    load_json_file(scenarios_file))
+
+
+@profiled()
+def export_nearest_open_locations(index: NearestOpenLocationIndex, output_directory: str,
+                                  cell_size_degrees: float = DEFAULT_CELL_SIZE_DEGREES,
+                                  k: int = DEFAULT_NEAREST_COUNT,
+                                  days: typing.Dict[str, typing.Collection[str]] = None) -> dict:
+    # when days are given only those scenario days are rebuilt, the files of the other days are kept as they are
+    from fetch_voting_locations.scenarios import remove_stale_scenario_days
+    grid = index.get_grid(cell_size_degrees)
+    if grid['columns'] == 0:
+        print('No geocoded locations, skipping the nearest open location export.')
+        return {}
+    nearest_directory = get_nearest_directory(output_directory)
+    nearest_file = os.path.join(nearest_directory, 'nearest.json')
+    previous = load_json_file(nearest_file) if os.path.isfile(nearest_file) else {}
+    if previous.get('grid') != grid or previous.get('k') != k:
+        days = None
+    results = {}
+    for scenario_name, scenario in index.scenarios.items():
+        scenario_directory = os.path.join(nearest_directory, scenario_name)
+        results[scenario_name] = []
+        for day in scenario.get('times', {}):
+            day_file = os.path.join(scenario_directory, f'{day}.json')
+            if days is not None and day not in days.get(scenario_name, ()) and \
+                    day in previous.get('days', {}).get(scenario_name, []):
+                results[scenario_name].append(day)
+                continue
+            with profile_span('nearest_cell_candidates', scenario=scenario_name, day=day):
+                cell_candidates = index.get_cell_candidates(scenario_name, day, grid, k)
+            if cell_candidates is None:
+                continue
+            write_json_file_atomically(day_file, cell_candidates, separators=(',', ':'))
+            results[scenario_name].append(day)
+    remove_stale_scenario_days(nearest_directory, results)
+    write_json_file_atomically(nearest_file, dict(grid=grid, k=k, days=results), indent=4)
+    return results
+
+
+class NearestRequestHandler(BaseHTTPRequestHandler):
+    server: 'NearestServer'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, data, status: int = 200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != NEAREST_PATH:
+            self._send_json(dict(message='Not found'), status=404)
+            return
+        parameters = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            lat, lng = float(parameters['lat']), float(parameters['lng'])
+            scenario, day = parameters.get('scenario', 'any_time'), parameters['day']
+            k = int(parameters.get('k', DEFAULT_NEAREST_COUNT))
+        except (KeyError, ValueError) as e:
+            self._send_json(dict(message=f'Expected lat, lng and day parameters: {e}'), status=400)
+            return
+        try:
+            locations = self.server.index.query(lat, lng, scenario, day, k)
+        except ValueError as e:
+            self._send_json(dict(message=str(e)), status=400)
+            return
+        self._send_json(dict(scenario=scenario, day=day, locations=locations))
+
+
+class NearestServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, index: NearestOpenLocationIndex, host: str = '127.0.0.1', port: int = 0,
+                 verbose: bool = False):
+        super().__init__((host, port), NearestRequestHandler)
+        self.index = index
+        self.verbose = verbose
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}{NEAREST_PATH}'
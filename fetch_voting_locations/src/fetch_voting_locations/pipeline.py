@@ -0,0 +1,117 @@
+import queue
+import threading
+import typing
+
+from fetch_voting_locations.geocoding import geocode_and_save_county, geocode_locations
+from fetch_voting_locations.geospatial import write_county_geojson, write_all_counties_geojson
+from fetch_voting_locations.location_files import save_county_voting_locations, save_all_county_voting_locations
+from fetch_voting_locations.location_store import update_location_store
+from fetch_voting_locations.progress import ProgressManifest, EXPORTED, raise_for_failed_counties
+from fetch_voting_locations.scrape import scrape_and_save_county, SOS_LOCATIONS_URL
+from fetch_voting_locations.utils.profiling import profile_span, profile_count
+
+_END_OF_STAGE = object()
+
+
+class CountyWork(typing.NamedTuple):
+    county: str
+    locations: typing.List[dict]
+
+
+def run_pipeline_stage(name: str, input_queue: queue.Queue, output_queue: typing.Optional[queue.Queue],
+                       function: typing.Callable[[CountyWork], typing.Optional[CountyWork]],
+                       failed_counties: list):
+    while True:
+        with profile_span(f'pipeline.{name}.idle'):
+            work = input_queue.get()
+        if work is _END_OF_STAGE:
+            if output_queue is not None:
+                output_queue.put(_END_OF_STAGE)
+            return
+        try:
+            with profile_span(f'pipeline.{name}', county=work.county):
+                result = function(work)
+        except Exception as e:
+            # the failure is recorded against the county, the remaining counties keep flowing
+            print(f'Pipeline stage {name} failed for county {work.county} due to exception: {e}')
+            failed_counties.append(work.county)
+            continue
+        if output_queue is not None and result is not None:
+            with profile_span(f'pipeline.{name}.blocked'):
+                output_queue.put(result)
+
+
+def resolve_deferred_geocodes(county: str, locations: typing.List[dict], deferred_locations: typing.List[dict],
+                              output_directory: str, manifest: ProgressManifest):
+    # choosing between several matches prompts on stdin, which only the main thread may do without interleaving
+    # with the scrape output, so the geocode stage leaves those locations for this step
+    print(f'Choosing between matches for {len(deferred_locations)} polling places in {county}.')
+    if geocode_locations(deferred_locations, county):
+        save_county_voting_locations(output_directory, county, locations)
+        write_county_geojson(locations, county, output_directory)
+    missing_geocodes = sum(1 for location in locations if 'lat' not in location or 'lng' not in location)
+    manifest.update(county, EXPORTED, missing_geocodes=missing_geocodes)
+
+
+def run_county_pipeline(election_id: str, output_directory: str, counties: typing.List[str],
+                        known_geocodes: dict = None, queue_size: int = 2,
+                        base_url: str = SOS_LOCATIONS_URL, manifest: ProgressManifest = None) -> dict:
+    # counties flow scrape -> geocode -> export through bounded queues, so the browser keeps scraping while MapBox
+    # requests are pending and files are written; the scrape stage stays on this thread since it owns the driver
+    if manifest is None:
+        manifest = ProgressManifest(output_directory)
+    geocode_queue = queue.Queue(maxsize=queue_size)
+    export_queue = queue.Queue(maxsize=queue_size)
+    failed_counties = []
+    all_locations = {}
+    deferred_geocodes = {}
+
+    def geocode(work: CountyWork) -> CountyWork:
+        deferred_locations = []
+        geocode_and_save_county(work.county, work.locations, output_directory, known_geocodes, manifest,
+                                interactive=False, deferred_locations=deferred_locations)
+        if len(deferred_locations) > 0:
+            deferred_geocodes[work.county] = deferred_locations
+        return work
+
+    def export(work: CountyWork) -> None:
+        try:
+            write_county_geojson(work.locations, work.county, output_directory)
+        except Exception as e:
+            manifest.fail(work.county, 'export', e)
+            raise
+        manifest.update(work.county, EXPORTED)
+        all_locations[work.county] = work.locations
+        profile_count('pipeline.counties')
+
+    workers = [
+        threading.Thread(target=run_pipeline_stage, name='geocode', daemon=True,
+                         args=('geocode', geocode_queue, export_queue, geocode, failed_counties)),
+        threading.Thread(target=run_pipeline_stage, name='export', daemon=True,
+                         args=('export', export_queue, None, export, failed_counties)),
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for county in counties:
+            try:
+                with profile_span('pipeline.scrape', county=county):
+                    locations = scrape_and_save_county(election_id, county, output_directory, manifest, base_url)
+            except Exception as e:
+                print(f'Pipeline stage scrape failed for county {county} due to exception: {e}')
+                failed_counties.append(county)
+                continue
+            with profile_span('pipeline.scrape.blocked'):
+                geocode_queue.put(CountyWork(county, locations))
+    finally:
+        geocode_queue.put(_END_OF_STAGE)
+        for worker in workers:
+            worker.join()
+    for county, deferred_locations in deferred_geocodes.items():
+        if county in all_locations:
+            resolve_deferred_geocodes(county, all_locations[county], deferred_locations, output_directory, manifest)
+    raise_for_failed_counties(sorted(failed_counties, key=counties.index))
+    all_locations = {county: all_locations[county] for county in counties}
+    save_all_county_voting_locations(output_directory, all_locations)
+    write_all_counties_geojson(update_location_store(output_directory, all_locations, counties), output_directory)
+    return all_locations
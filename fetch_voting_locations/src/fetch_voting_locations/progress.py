@@ -0,0 +1,80 @@
+import datetime
+import os
+import threading
+import typing
+
+from fetch_voting_locations.location_files import load_json_file, write_json_file_atomically
+
+PROGRESS_MANIFEST_FILE = 'progress.json'
+SCRAPED = 'scraped'
+GEOCODED = 'geocoded'
+EXPORTED = 'exported'
+FAILED = 'failed'
+# states in which the county's json file holds a completed scrape, even if it found no locations
+SCRAPED_STATES = (SCRAPED, GEOCODED, EXPORTED)
+
+
+class ProgressManifest:
+    def __init__(self, output_directory: str, resume: bool = False):
+        self.file_path = os.path.join(output_directory, PROGRESS_MANIFEST_FILE)
+        self.resume = resume
+        self._lock = threading.Lock()
+        self.counties = {}
+        if os.path.isfile(self.file_path):
+            try:
+                self.counties = load_json_file(self.file_path).get('counties', {})
+            except Exception as e:
+                print(f'Failed to load progress manifest {self.file_path} due to exception: {e}')
+
+    def get_state(self, county: str) -> typing.Optional[str]:
+        with self._lock:
+            return self.counties.get(county, {}).get('state')
+
+    def has_reached(self, county: str, state: str) -> bool:
+        # only trusted when resuming, otherwise every stage is re-checked as before
+        with self._lock:
+            progress = dict(self.counties.get(county, {}))
+        county_state = progress.get('state')
+        if not self.resume or county_state not in SCRAPED_STATES:
+            return False
+        if progress.get('missing_geocodes', 0) > 0:
+            # locations left without coordinates, e.g. by a transient MapBox failure, are retried on every run
+            county_state = SCRAPED
+        return SCRAPED_STATES.index(county_state) >= SCRAPED_STATES.index(state)
+
+    def failed_counties(self) -> typing.List[str]:
+        with self._lock:
+            return sorted(county for county, progress in self.counties.items() if progress.get('state') == FAILED)
+
+    def update(self, county: str, state: str, **details):
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        with self._lock:
+            progress = self.counties.setdefault(county, {})
+            progress.update(details, state=state, updated_at=now)
+            progress[f'{state}_at'] = now
+            if state != FAILED:
+                progress.pop('error', None)
+                progress.pop('failed_stage', None)
+            self._save()
+
+    def mark_counties(self, counties: typing.List[str], state: str):
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        with self._lock:
+            for county in counties:
+                progress = self.counties.setdefault(county, {})
+                progress.update(state=state, updated_at=now)
+                progress[f'{state}_at'] = now
+            self._save()
+
+    def fail(self, county: str, stage: str, error: Exception):
+        print(f'Failed to {stage} county {county} due to exception: {error}')
+        self.update(county, FAILED, failed_stage=stage, error=str(error))
+
+    def _save(self):
+        write_json_file_atomically(self.file_path, dict(counties=self.counties))
+
+
+def raise_for_failed_counties(failed_counties: typing.List[str]):
+    if len(failed_counties) > 0:
+        raise RuntimeError(f'{len(failed_counties)} counties failed: {", ".join(failed_counties)}. '
+                           f'Re-run with --resume to retry only these counties.')
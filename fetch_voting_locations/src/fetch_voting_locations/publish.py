@@ -0,0 +1,136 @@
+import datetime
+import glob
+import gzip
+import hashlib
+import json
+import os
+import typing
+
+from fetch_voting_locations.location_files import load_json_file, write_json_file_atomically, \
+    write_bytes_file_atomically
+from fetch_voting_locations.utils.profiling import profiled, profile_span
+
+PUBLISH_DIRECTORY = 'published'
+PUBLISH_MANIFEST_FILE = 'manifest.json'
+# the outputs js/dataset.js reads, relative to the election directory; other outputs such as nearest/**/*.json are
+# only published when their patterns are passed in
+PUBLISHED_PATTERNS = [
+    'counties.json',
+    'county_boundaries/*.json',
+    'county_boundaries/*.geojson',
+    'json/*.json',
+    'geojson/*.geojson',
+    'scenarios/scenarios.json',
+]
+COMPRESSED_EXTENSIONS = {'gzip': '.gz', 'br': '.br'}
+# read by js/last_updated.js, which shows it when the data was published after the last commit
+LAST_UPDATED_FILE = 'last_updated.json'
+
+
+def get_publish_directory(output_directory: str) -> str:
+    return os.path.join(output_directory, PUBLISH_DIRECTORY)
+
+
+def find_published_sources(output_directory: str, patterns: typing.List[str] = None) -> typing.List[str]:
+    sources = set()
+    for pattern in patterns or PUBLISHED_PATTERNS:
+        for file_path in glob.glob(os.path.join(output_directory, pattern), recursive=True):
+            if os.path.isfile(file_path):
+                sources.add(os.path.relpath(file_path, output_directory).replace(os.sep, '/'))
+    return sorted(sources)
+
+
+def minify_json(file_path: str) -> bytes:
+    return json.dumps(load_json_file(file_path), separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def get_hashed_path(relative_path: str, content: bytes) -> str:
+    # the hash is part of the name, so published files never change and can be cached indefinitely
+    stem, extension = os.path.splitext(relative_path)
+    return f'{stem}.{hashlib.blake2b(content, digest_size=8).hexdigest()}{extension}'
+
+
+def get_brotli_compress() -> typing.Optional[typing.Callable[[bytes], bytes]]:
+    try:
+        import brotli
+    except ImportError:
+        print('brotli is not installed, only gzip variants will be published.')
+        return None
+    return lambda content: brotli.compress(content, quality=11)
+
+
+def get_published_variants(hashed_path: str, encodings: typing.List[str]) -> typing.List[str]:
+    return [hashed_path] + [hashed_path + COMPRESSED_EXTENSIONS[encoding] for encoding in encodings]
+
+
+def publish_file(hashed_file: str, content: bytes, brotli_compress: typing.Callable[[bytes], bytes] = None):
+    variants = {hashed_file: lambda: content,
+                hashed_file + COMPRESSED_EXTENSIONS['gzip']: lambda: gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli_compress is not None:
+        variants[hashed_file + COMPRESSED_EXTENSIONS['br']] = lambda: brotli_compress(content)
+    for variant_file, compress in variants.items():
+        # an existing hashed file already holds exactly this content
+        if not os.path.isfile(variant_file):
+            write_bytes_file_atomically(variant_file, compress())
+
+
+def prune_published_files(publish_directory: str, keep: typing.Set[str]) -> int:
+    removed = 0
+    for file_path in glob.glob(os.path.join(publish_directory, '**', '*'), recursive=True):
+        relative_path = os.path.relpath(file_path, publish_directory).replace(os.sep, '/')
+        if os.path.isfile(file_path) and relative_path != PUBLISH_MANIFEST_FILE and relative_path not in keep:
+            os.remove(file_path)
+            removed += 1
+    for directory, _, _ in sorted(os.walk(publish_directory), reverse=True):
+        if directory != publish_directory and len(os.listdir(directory)) == 0:
+            os.rmdir(directory)
+    return removed
+
+
+@profiled()
+def publish_election(output_directory: str, brotli: bool = True, patterns: typing.List[str] = None) -> bool:
+    publish_directory = get_publish_directory(output_directory)
+    manifest_file = os.path.join(publish_directory, PUBLISH_MANIFEST_FILE)
+    previous_manifest = load_json_file(manifest_file) if os.path.isfile(manifest_file) else {}
+    brotli_compress = get_brotli_compress() if brotli else None
+    encodings = ['gzip'] + (['br'] if brotli_compress is not None else [])
+    files = {}
+    for relative_path in find_published_sources(output_directory, patterns):
+        with profile_span('publish_file', file=relative_path):
+            content = minify_json(os.path.join(output_directory, relative_path))
+            hashed_path = get_hashed_path(relative_path, content)
+            publish_file(os.path.join(publish_directory, hashed_path), content, brotli_compress)
+        files[relative_path] = hashed_path
+    changed = files != previous_manifest.get('files') or encodings != previous_manifest.get('encodings')
+    manifest = dict(previous_manifest, files=files, encodings=encodings)
+    if changed:
+        manifest['published_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+    # the previous generation is kept too, so clients still holding the old manifest can finish loading
+    keep = set()
+    for published_files, published_encodings in [(files, encodings), (previous_manifest.get('files', {}),
+                                                                       previous_manifest.get('encodings', []))]:
+        for hashed_path in published_files.values():
+            keep.update(get_published_variants(hashed_path, published_encodings))
+    write_json_file_atomically(manifest_file, manifest, indent=4, sort_keys=True)
+    removed = prune_published_files(publish_directory, keep)
+    print(f'Published {len(files)} files to {publish_directory} ({"changed" if changed else "unchanged"}), '
+          f'removed {removed} stale files.')
+    return changed
+
+
+def write_last_updated_file(output_directory: str, last_updated: datetime.datetime = None):
+    if last_updated is None:
+        last_updated = datetime.datetime.now(datetime.timezone.utc)
+    write_json_file_atomically(os.path.join(get_publish_directory(output_directory), LAST_UPDATED_FILE),
+                               dict(last_updated=last_updated.isoformat(timespec='seconds')), indent=4)
+
+
+def publish(election_output_directories: typing.List[str], output_directory: str, brotli: bool = True,
+            patterns: typing.List[str] = None) -> bool:
+    # the elections are published into their own directories, the time of the last change into the data directory
+    changed = False
+    for election_output_directory in election_output_directories:
+        changed = publish_election(election_output_directory, brotli, patterns) or changed
+    if changed:
+        write_last_updated_file(output_directory)
+    return changed
@@ -0,0 +1,167 @@
+import datetime
+import json
+import os
+import re
+import shutil
+import typing
+
+from fetch_voting_locations.location_files import ALL_LOCATIONS_ID, load_json_file, write_json_file_atomically
+from fetch_voting_locations.utils.profiling import profiled, profile_span
+
+
+schedule_regex = re.compile(r'(?P<start>\d\d/\d\d/\d{4})\s*-\s*(?P<end>\d\d/\d\d/\d{4})\s*'
+                            r'(?P<start_time>\d+:\d+\s*[APap][Mm])'
+                            r'\s*-\s*'
+                            r'(?P<end_time>\d+:\d+\s*[APap][Mm])')
+
+
+def parse_date(date_string: str) -> datetime.date:
+    month, day, year = list(map(int, date_string.split('/')))
+    return datetime.date(year, month, day)
+
+
+def parse_time(time_string: str) -> datetime.time:
+    hour = int(time_string.split(':')[0])
+    if hour != 12 and 'pm' in time_string.lower():
+        hour += 12
+    minute = int(time_string.split(':')[1][:2])
+    result = datetime.time(hour=hour, minute=minute)
+    return result
+
+
+def is_location_open_on_datetime(location: dict, day: datetime.date, time_filter: datetime.time) -> bool:
+    assert isinstance(location.get('schedule'), list), f'No schedule found for location: {location["name"]}'
+    for time_span_text in location['schedule']:
+        schedule = schedule_regex.search(time_span_text)
+        start = parse_date(schedule.group('start'))
+        end = parse_date(schedule.group('end'))
+        if not (start <= day <= end):
+            continue
+        if time_filter is None:
+            return True
+        start_time = parse_time(schedule.group('start_time'))
+        end_time = parse_time(schedule.group('end_time'))
+        if start_time <= time_filter <= end_time:
+            return True
+    return False
+
+
+def filter_voting_locations_by_datetime(location_store, day: datetime.date, out_file_path: str,
+                                        time_filter: datetime.time = None):
+    from fetch_voting_locations.location_store import find_open_location_ids, group_location_ids_by_county
+    results = {}
+    file_exists = False
+    if os.path.isfile(out_file_path):
+        try:
+            with open(out_file_path, 'rt') as in_file:
+                results = json.load(in_file)
+            file_exists = True
+        except Exception as e:
+            print(f'Failed to load cached filtered locations from {out_file_path} due to exception: {e}')
+    if len(results) == 0:
+        open_location_ids = find_open_location_ids(location_store.schedule_intervals, day, time_filter)
+        results = group_location_ids_by_county(location_store.locations, open_location_ids)
+    if not file_exists:
+        with open(out_file_path, 'wt') as out_file:
+            json.dump(results, out_file, indent=4, sort_keys=True)
+    return results
+
+
+def get_scenario_days(scenario_options: dict) -> typing.Tuple[typing.List[datetime.date], datetime.time]:
+    start_date = datetime.date.fromisoformat(scenario_options['start_date'])
+    end_date = datetime.date.fromisoformat(scenario_options['end_date'])
+    time_filter = scenario_options.get('time_filter')
+    if isinstance(time_filter, str):
+        time_filter = parse_time(time_filter)
+    days = []
+    while start_date <= end_date:
+        days.append(start_date)
+        start_date += datetime.timedelta(days=1)
+    return days, time_filter
+
+
+@profiled()
+def generate_voting_location_subsets(location_store, scenarios: dict, output_directory: str):
+    if isinstance(location_store, dict):
+        from fetch_voting_locations.location_store import build_location_store
+        location_store = build_location_store(location_store, [k for k in location_store if k != ALL_LOCATIONS_ID])
+    results = {}
+    os.makedirs(output_directory, exist_ok=True)
+    for scenario_name, scenario_options in scenarios.items():
+        results[scenario_name] = {}
+        scenario_directory = os.path.join(output_directory, scenario_name)
+        os.makedirs(scenario_directory, exist_ok=True)
+        days, time_filter = get_scenario_days(scenario_options)
+        scenario_times = {}
+        for day in days:
+            with profile_span('filter_voting_locations_by_datetime', scenario=scenario_name, day=day):
+                open_polls = filter_voting_locations_by_datetime(
+                    location_store, day,
+                    os.path.join(scenario_directory, f'{day.isoformat()}.json'), time_filter
+                )
+            if len(open_polls) > 0:
+                scenario_times[day.isoformat()] = open_polls
+        results[scenario_name]['times'] = scenario_times
+        results[scenario_name]['info'] = scenario_options['info']
+    with open(os.path.join(output_directory, 'scenarios.json'), 'wt') as out_file:
+        json.dump(results, out_file, indent=4)
+    return results
+
+
+def remove_stale_scenario_days(directory: str, days_by_scenario: typing.Dict[str, typing.Collection[str]]) -> int:
+    # per day outputs are named after their ISO day, e.g. 2026-05-19.json, 2026-05-19_gaps.geojson or 2026-05-19/
+    removed = 0
+    if not os.path.isdir(directory):
+        return removed
+    for scenario_name in os.listdir(directory):
+        scenario_directory = os.path.join(directory, scenario_name)
+        if not os.path.isdir(scenario_directory):
+            continue
+        days = days_by_scenario.get(scenario_name, ())
+        for entry in os.listdir(scenario_directory):
+            try:
+                datetime.date.fromisoformat(entry[:10])
+            except ValueError:
+                continue
+            if entry[:10] in days:
+                continue
+            entry_path = os.path.join(scenario_directory, entry)
+            if os.path.isdir(entry_path):
+                shutil.rmtree(entry_path)
+            else:
+                os.remove(entry_path)
+            removed += 1
+        if len(os.listdir(scenario_directory)) == 0:
+            os.rmdir(scenario_directory)
+    return removed
+
+
+@profiled()
+def refresh_voting_location_subsets(location_store, scenarios: dict,
+                                    output_directory: str) -> typing.Tuple[dict, typing.Dict[str, typing.Set[str]]]:
+    # unlike generate_voting_location_subsets every day is recomputed rather than read back, and only the days whose
+    # open polling places changed are rewritten and reported, so later stages can rebuild just those days
+    from fetch_voting_locations.location_store import find_open_location_ids, group_location_ids_by_county
+    results = {}
+    changed_days = {}
+    scenario_days = {}
+    for scenario_name, scenario_options in scenarios.items():
+        scenario_directory = os.path.join(output_directory, scenario_name)
+        days, time_filter = get_scenario_days(scenario_options)
+        scenario_days[scenario_name] = [day.isoformat() for day in days]
+        scenario_times = {}
+        changed_days[scenario_name] = set()
+        for day in days:
+            open_polls = group_location_ids_by_county(
+                location_store.locations, find_open_location_ids(location_store.schedule_intervals, day, time_filter))
+            day_file = os.path.join(scenario_directory, f'{day.isoformat()}.json')
+            previous_open_polls = load_json_file(day_file) if os.path.isfile(day_file) else None
+            if open_polls != previous_open_polls:
+                write_json_file_atomically(day_file, open_polls, indent=4, sort_keys=True)
+                changed_days[scenario_name].add(day.isoformat())
+            if len(open_polls) > 0:
+                scenario_times[day.isoformat()] = open_polls
+        results[scenario_name] = dict(times=scenario_times, info=scenario_options['info'])
+    remove_stale_scenario_days(output_directory, scenario_days)
+    write_json_file_atomically(os.path.join(output_directory, 'scenarios.json'), results, indent=4)
+    return results, changed_days
@@ -0,0 +1,291 @@
+import json
+import os
+import time
+import typing
+from functools import lru_cache
+from urllib.parse import quote
+
+from tqdm import tqdm
+from selenium.common import StaleElementReferenceException
+from selenium.webdriver import ActionChains
+from selenium.webdriver.common.by import By
+
+from fetch_voting_locations.location_files import get_counties_file, load_county_voting_locations, \
+    save_county_voting_locations
+from fetch_voting_locations.progress import ProgressManifest, SCRAPED, raise_for_failed_counties
+from fetch_voting_locations.utils.profiling import profile_span, profile_count
+
+
+@lru_cache()
+def get_gecko_driver():
+    gecko_tempdir = './tmp_gecko'
+    os.environ['TMPDIR'] = gecko_tempdir
+    os.makedirs(gecko_tempdir, exist_ok=True)
+    from webdriver_manager.firefox import GeckoDriverManager
+    return GeckoDriverManager().install()
+
+
+@lru_cache()
+def get_driver(browser: str = 'firefox'):
+    if browser == 'chromium':
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service as ChromiumService
+        from webdriver_manager.chrome import ChromeDriverManager
+        from webdriver_manager.core.os_manager import ChromeType
+
+        driver = webdriver.Chrome(
+            service=ChromiumService(ChromeDriverManager(chrome_type=ChromeType.CHROMIUM).install()))
+    elif browser == 'firefox':
+        from selenium import webdriver
+        from selenium.webdriver.firefox.service import Service as FirefoxService
+        driver = webdriver.Firefox(service=FirefoxService(get_gecko_driver()))
+    else:
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service as ChromeService
+        from webdriver_manager.chrome import ChromeDriverManager
+        driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()))
+    import atexit
+    atexit.register(driver.close)
+    return driver
+
+
+def reset_driver():
+    # a long running process replaces a crashed browser instead of failing every later county
+    if get_driver.cache_info().currsize == 0:
+        return
+    driver = get_driver()
+    get_driver.cache_clear()
+    import atexit
+    atexit.unregister(driver.close)
+    try:
+        driver.quit()
+    except Exception as e:
+        print(f'Failed to quit the browser due to exception: {e}')
+
+
+def extract_results_from_page(driver) -> typing.List[dict]:
+    wait_for_back_button(driver)
+    locations = fetch_location_elements(driver)
+    return locations
+
+
+def get_buttons(driver):
+    return driver.find_elements(by=By.CLASS_NAME, value="slds-button")
+
+
+def get_button_with_text(driver, text: str = 'NEXT', ignore_disabled: bool = True):
+    for button in get_buttons(driver):
+        try:
+            if button.text == text:
+                if ignore_disabled and button.get_attribute('aria-disabled') == 'true':
+                    continue
+                return button
+        except StaleElementReferenceException:
+            return None
+
+
+def get_enabled_next_button(driver):
+    return get_button_with_text(driver, text='NEXT')
+
+
+def get_enabled_back_button(driver):
+    return get_button_with_text(driver, text='BACK')
+
+
+def is_element_visible_in_viewpoint(driver, element) -> bool:
+    return element.is_displayed()
+
+
+def advance_to_next_page(driver):
+    button = None
+    while button is None:
+        button = get_enabled_next_button(driver)
+        if not page_has_more_results(driver):
+            print('No more results can be found')
+            return
+    assert button is not None, f'No next page button found!'
+    while not is_element_visible_in_viewpoint(driver, button):
+        ActionChains(driver).move_to_element(button).perform()
+    for attempt in range(3):
+        try:
+            button.click()
+            return
+        except:
+            pass
+
+
+def wait_for_back_button(driver):
+    found_back_button_enabled = False
+    with profile_span('scrape.wait_for_back_button'):
+        while not found_back_button_enabled:
+            time.sleep(1)
+            found_back_button_enabled = get_enabled_back_button(driver) is not None
+
+
+def page_has_more_results(driver) -> bool:
+    try:
+        next_button = get_enabled_next_button(driver)
+        back_button = get_enabled_back_button(driver)
+        return back_button is None or next_button is not None
+    except Exception as e:
+        return True  # still loading
+
+
+def fetch_location_elements(driver) -> typing.List[dict]:
+    location_elements = []
+    property_names = {
+        'County': 'county',
+        'Election': 'election',
+        'LOCATION NAME': 'name',
+        'LOCATION ADDRESS': 'address',
+        'LOCATION HOURS OF OPERATION': 'schedule'
+    }
+    polling_place_results = driver.find_elements(by=By.TAG_NAME, value='c-vr-wi-adv-polling-place-result')
+    assert len(polling_place_results) == 1, f'{len(polling_place_results)} polling place results found!'
+    potential_location_elements = polling_place_results[0].find_elements(by=By.CLASS_NAME, value="slds-button")
+    potential_location_elements = list(
+        filter(lambda _x: _x.text == 'DIRECTIONS TO POLLING PLACE', potential_location_elements))
+    for element in tqdm(potential_location_elements):
+        potential_element = element
+        for parent_attempt in range(3):
+            if potential_element.get_attribute('class') != 'slds-card':
+                potential_element = potential_element.find_element(By.XPATH, "..")
+            else:
+                break
+        location = dict()
+        element = potential_element
+        for property_element in element.find_elements(by=By.CLASS_NAME, value='text-muted'):
+            output_property_name = property_names.get(property_element.text)
+            if output_property_name is not None:
+                value_elements = property_element.find_elements(By.XPATH, "following-sibling::*")
+                if len(value_elements) == 1 and output_property_name != 'schedule':
+                    location[output_property_name] = value_elements[0].text
+                else:
+                    location[output_property_name] = list(map(lambda _x: _x.text, value_elements))
+        if len(location) == len(property_names):
+            location_name = location['name']
+            location_elements.append(location)
+            print(f'Location #{len(location_elements)}: {location_name} found!')
+    return location_elements
+
+
+@lru_cache()
+def get_list_of_counties(cache_file: str = 'counties.json') -> typing.List[str]:
+    result = ['FULTON']
+    if os.path.isfile(cache_file):
+        with open(cache_file, 'r') as f:
+            result = json.load(f)
+        if len(result) > 0:
+            return result
+    try:
+        locations_url = SOS_LOCATIONS_URL
+        driver = get_driver()
+        driver.implicitly_wait(10)
+        driver.get(locations_url)
+        polling_places = driver.find_element(by=By.TAG_NAME, value='c-vr-wi-adv-voting-location-info')
+        for attempt in range(3):
+            try:
+                county_dropdown_button = polling_places.find_element(by=By.XPATH,
+                                                                     value='//button[@aria-label="County Name"]')
+                county_dropdown_button.click()
+                break
+            except Exception as e:
+                time.sleep(3)
+        county_dropdown_element = polling_places.find_element(by=By.XPATH, value='//div[@aria-label="County Name"]')
+        for attempt in range(3):
+            if len(county_dropdown_element.text) == 0:
+                time.sleep(3)
+        result = county_dropdown_element.text.split('\n')
+        with open(cache_file, 'w') as f:
+            json.dump(result, f)
+    except Exception as e:
+        print(f'Failed to get list of counties: {e}. Defaulting to {result}')
+    return result
+
+
+SOS_LOCATIONS_URL = 'https://mvp.sos.ga.gov/s/advanced-voting-location-information'
+
+
+def fetch_early_voting_locations(
+        election_id='',
+        county='FULTON', base_url: str = SOS_LOCATIONS_URL):
+    locations, pages = fetch_early_voting_location_pages(election_id, county, base_url)
+    return locations
+
+
+def get_sos_locations_url(election_id: str, county: str, base_url: str = SOS_LOCATIONS_URL) -> str:
+    if base_url.startswith('file://'):
+        # saved fixture pages, laid out as utils.replay.write_sos_fixture_pages writes them
+        return f'{base_url.rstrip("/")}/sos/{quote(election_id)}/{quote(county)}/page-1.html'
+    parameters = f'page=advpollingplace&election={election_id}&countyName={county}'
+    return f'{base_url}?{parameters}'
+
+
+def fetch_early_voting_location_pages(
+        election_id='',
+        county='FULTON', base_url: str = SOS_LOCATIONS_URL) -> typing.Tuple[typing.List[dict], int]:
+    locations_url = get_sos_locations_url(election_id, county, base_url)
+    with profile_span('fetch_early_voting_locations', county=county):
+        driver = get_driver()
+        driver.implicitly_wait(10)
+        with profile_span('scrape.page_load', county=county):
+            driver.get(locations_url)
+            time.sleep(3)
+        locations = []
+        more_results = True
+        pages = 0
+        while more_results:
+            wait_for_back_button(driver)
+            with profile_span('scrape.extract_page', county=county, page=pages):
+                new_locations = extract_results_from_page(driver)
+            locations.extend(new_locations)
+            more_results = page_has_more_results(driver)
+            pages += 1
+            profile_count('scrape.pages')
+            print(f'Scanned {pages} pages for county {county}')
+            if more_results:
+                print(f'Advancing to next page for county {county}')
+                with profile_span('scrape.advance_page', county=county):
+                    advance_to_next_page(driver)
+        profile_count('scrape.locations', len(locations))
+    locations_dict = {}
+    for i, location in enumerate(locations):
+        locations_dict[f'{i}-{location["name"]}'] = location
+    return locations, pages
+
+
+def scrape_and_save_county(election_id: str, county: str, output_directory: str,
+                           manifest: ProgressManifest = None, base_url: str = SOS_LOCATIONS_URL) -> typing.List[dict]:
+    locations = load_county_voting_locations(output_directory, county)
+    if locations is not None and manifest is not None and manifest.has_reached(county, SCRAPED):
+        return locations
+    if locations is None or len(locations) == 0:
+        try:
+            locations, pages = fetch_early_voting_location_pages(election_id, county, base_url)
+            save_county_voting_locations(output_directory, county, locations)
+        except Exception as e:
+            if manifest is not None:
+                manifest.fail(county, 'scrape', e)
+            raise
+        if manifest is not None:
+            manifest.update(county, SCRAPED, pages=pages, locations=len(locations))
+    elif manifest is not None and manifest.get_state(county) is None:
+        manifest.update(county, SCRAPED, locations=len(locations))
+    return locations
+
+
+def scrape_county_voting_locations(election_id: str, output_directory: str, counties: typing.List[str] = None,
+                                   base_url: str = SOS_LOCATIONS_URL, resume: bool = False) -> dict:
+    os.makedirs(output_directory, exist_ok=True)
+    if counties is None:
+        counties = get_list_of_counties(get_counties_file(output_directory))
+    manifest = ProgressManifest(output_directory, resume)
+    all_locations = {}
+    failed_counties = []
+    for county in counties:
+        try:
+            all_locations[county] = scrape_and_save_county(election_id, county, output_directory, manifest, base_url)
+        except Exception:
+            failed_counties.append(county)
+    raise_for_failed_counties(failed_counties)
+    return all_locations
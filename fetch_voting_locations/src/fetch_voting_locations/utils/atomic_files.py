@@ -0,0 +1,35 @@
+import json
+import os
+import tempfile
+import typing
+
+
+def write_file_atomically(file_path: str, write_callback: typing.Callable[[str], None]):
+    # write next to the destination then rename over it, so an interrupted run never leaves a truncated file;
+    # write_callback receives the temporary file path to write to
+    directory = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(directory, exist_ok=True)
+    file_descriptor, temporary_file_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(file_descriptor)
+    try:
+        write_callback(temporary_file_path)
+        os.chmod(temporary_file_path, 0o644)
+        os.replace(temporary_file_path, file_path)
+    except BaseException:
+        if os.path.exists(temporary_file_path):
+            os.remove(temporary_file_path)
+        raise
+
+
+def write_json_file_atomically(file_path: str, data, **json_kwargs):
+    def write_json(temporary_file_path: str):
+        with open(temporary_file_path, 'wt') as out_file:
+            json.dump(data, out_file, **json_kwargs)
+    write_file_atomically(file_path, write_json)
+
+
+def write_bytes_file_atomically(file_path: str, content: bytes):
+    def write_bytes(temporary_file_path: str):
+        with open(temporary_file_path, 'wb') as out_file:
+            out_file.write(content)
+    write_file_atomically(file_path, write_bytes)
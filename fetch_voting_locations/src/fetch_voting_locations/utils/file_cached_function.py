@@ -1,9 +1,15 @@
 import os
 import pickle
 import json
-from typing import Callable, Literal
+from contextlib import contextmanager
+from typing import Callable, Dict, Literal, Optional, Tuple
 import atexit
-from hashlib import sha512
+from hashlib import blake2b, sha512
+
+from fetch_voting_locations.utils.atomic_files import write_json_file_atomically, write_bytes_file_atomically
+from fetch_voting_locations.utils.profiling import profile_count, profile_span
+
+CACHE_KEY_VERSION = 'v2'
 
 
 def args_hasher(*args) -> str:
@@ -23,21 +29,43 @@ def default_hasher(*args, **kwargs) -> str:
     return result
 
 
+def canonical_hasher(*args, **kwargs) -> str:
+    # a single short hash over one canonical encoding, instead of nested SHA-512 passes over str() of each argument;
+    # the version prefix keeps these keys apart from the legacy ones above
+    serialized = json.dumps([args, kwargs], sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return f'{CACHE_KEY_VERSION}-{blake2b(serialized.encode("utf-8"), digest_size=16).hexdigest()}'
+
+
+def is_legacy_key(key: str) -> bool:
+    return not key.startswith(f'{CACHE_KEY_VERSION}-')
+
+
+class CacheMissError(KeyError):
+    pass
+
+
 class FileCachedFunction:
     def __init__(self,
                  function: Callable = None,
                  cache_directory: str = 'cache',
-                 parameter_hasher: Callable = default_hasher,
+                 parameter_hasher: Callable = canonical_hasher,
                  cache_format: Literal['json', 'pickle'] = 'json',
                  cache_schedule: Literal['atexit', 'immediate'] = 'immediate',
+                 legacy_parameter_hasher: Optional[Callable] = default_hasher,
                  ):
         self.cache_directory = os.path.abspath(cache_directory)
         self.parameter_hasher = parameter_hasher
+        # entries written before keys were versioned are still found through the hasher that named them
+        self.legacy_parameter_hasher = legacy_parameter_hasher
+        # offline calls raise CacheMissError instead of running the function; see track_cache_keys
+        self.offline = False
+        self.tracked_keys: Optional[Dict[str, Optional[str]]] = None
         self._cache = {}
         self.cache_format = cache_format
         self._modified_cache_queue = []
         self.cache_schedule = cache_schedule
         self.function = function
+        self.cache_name = os.path.basename(self.cache_directory)
         atexit.register(self._save_modified_cache_queue)
 
     def _get_cache_file(self, key: str):
@@ -59,13 +87,11 @@ class FileCachedFunction:
             return cache
 
     def _save_cache_file(self, file_path: str, data):
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # replaced rather than rewritten in place, since compaction may hard link identical entries together
         if self.cache_format == 'pickle':
-            with open(file_path, 'wb') as f:
-                pickle.dump(data, f)
+            write_bytes_file_atomically(file_path, pickle.dumps(data))
         elif self.cache_format == 'json':
-            with open(file_path, 'w') as f:
-                json.dump(data, f, indent=4, sort_keys=True)
+            write_json_file_atomically(file_path, data, indent=4, sort_keys=True)
 
     def _save_cache(self, key: str, value):
         self._cache[key] = value
@@ -96,30 +122,63 @@ class FileCachedFunction:
     def get_key(self, *args, **kwargs) -> str:
         return self.parameter_hasher(*args, **kwargs)
 
-    def clear_cache(self, *args, **kwargs):
+    def find_key(self, *args, **kwargs) -> Tuple[str, Optional[str]]:
+        # the current key and the key the result is stored under, which is a legacy key for older entries
         key = self.get_key(*args, **kwargs)
         if key in self:
-            del self[key]
-        cache_file_path = self._get_cache_file(key)
-        if os.path.isfile(cache_file_path):
-            os.remove(cache_file_path)
+            return key, key
+        if self.legacy_parameter_hasher is not None:
+            legacy_key = self.legacy_parameter_hasher(*args, **kwargs)
+            if legacy_key in self:
+                return key, legacy_key
+        return key, None
+
+    def get_cache_files(self) -> Dict[str, str]:
+        if not os.path.isdir(self.cache_directory):
+            return {}
+        extension = f'.{self.cache_format}'
+        return {file_name[:-len(extension)]: os.path.join(self.cache_directory, file_name)
+                for file_name in sorted(os.listdir(self.cache_directory)) if file_name.endswith(extension)}
+
+    def clear_cache(self, *args, **kwargs):
+        keys = [self.get_key(*args, **kwargs)]
+        if self.legacy_parameter_hasher is not None:
+            keys.append(self.legacy_parameter_hasher(*args, **kwargs))
+        for key in keys:
+            if key in self._cache:
+                del self[key]
+            cache_file_path = self._get_cache_file(key)
+            if os.path.isfile(cache_file_path):
+                os.remove(cache_file_path)
 
     def __call__(self, *args, **kwargs):
-        key = self.parameter_hasher(*args, **kwargs)
-        if key not in self:
-            result = self.function(*args, **kwargs)
-            self._save_cache(key, result)
+        key, stored_key = self.find_key(*args, **kwargs)
+        if self.tracked_keys is not None:
+            self.tracked_keys[key] = stored_key
+        if stored_key is None:
+            if self.offline:
+                raise CacheMissError(f'No cached {self.cache_name} result for key {key}')
+            profile_count(f'cache.{self.cache_name}.miss')
+            with profile_span(f'cache.{self.cache_name}.miss'):
+                result = self.function(*args, **kwargs)
+                self._save_cache(key, result)
             return result
-        return self[key]
+        if stored_key != key:
+            profile_count(f'cache.{self.cache_name}.legacy_hit')
+        profile_count(f'cache.{self.cache_name}.hit')
+        with profile_span(f'cache.{self.cache_name}.hit'):
+            return self[stored_key]
 
     @staticmethod
     def decorate(cache_directory: str = 'cache',
-                 parameter_hasher: Callable = default_hasher,
+                 parameter_hasher: Callable = canonical_hasher,
                  cache_format: Literal['json', 'pickle'] = 'json',
-                 cache_schedule: Literal['atexit', 'immediate'] = 'immediate'):
+                 cache_schedule: Literal['atexit', 'immediate'] = 'immediate',
+                 legacy_parameter_hasher: Optional[Callable] = default_hasher):
         def decorator(function):
             decorated_kwargs = dict(cache_directory=cache_directory, parameter_hasher=parameter_hasher,
-                                    cache_format=cache_format, cache_schedule=cache_schedule)
+                                    cache_format=cache_format, cache_schedule=cache_schedule,
+                                    legacy_parameter_hasher=legacy_parameter_hasher)
             decorated_kwargs.update(function=function)
             decorated_function = FileCachedFunction(**decorated_kwargs)
             return decorated_function
@@ -127,6 +186,20 @@ class FileCachedFunction:
         return decorator
 
 
+@contextmanager
+def track_cache_keys(*cached_functions: FileCachedFunction, offline: bool = True):
+    # records, for every call, the current key and the key its result was found under (None on a miss)
+    previous_states = [(cached_function.tracked_keys, cached_function.offline) for cached_function in cached_functions]
+    for cached_function in cached_functions:
+        cached_function.tracked_keys = {}
+        cached_function.offline = offline
+    try:
+        yield [cached_function.tracked_keys for cached_function in cached_functions]
+    finally:
+        for cached_function, (tracked_keys, offline) in zip(cached_functions, previous_states):
+            cached_function.tracked_keys, cached_function.offline = tracked_keys, offline
+
+
 def main():
     def test_fun(*args, **kwargs):
         result = dict(args=args, **kwargs)
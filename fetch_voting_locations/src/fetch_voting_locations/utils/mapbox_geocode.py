@@ -2,15 +2,16 @@ import json
 import os
 import time
 import typing
+from contextlib import contextmanager
 from configparser import ConfigParser
 from argparse import ArgumentParser
 from datetime import datetime, timedelta
 from functools import lru_cache
 
 import requests
-import pandas as pd
 
-from fetch_voting_locations.utils.file_cached_function import FileCachedFunction, kwargs_hasher
+from fetch_voting_locations.utils.file_cached_function import FileCachedFunction, kwargs_hasher, canonical_hasher
+from fetch_voting_locations.utils.profiling import profile_span
 
 
 @lru_cache
@@ -45,21 +46,44 @@ STRUCTURED_ADDRESS_KWARGS = [
 ]
 
 
-def mapbox_geocode_parameters_hasher(*args, **kwargs):
+def get_mapbox_geocode_parameters(*args, **kwargs) -> dict:
+    # only the parameters which change the answer; the access token and request delay are left out of cache keys
     assert len(args) == 0, f'Only kwargs are supported! Received unnamed args: {args}!'
-    filtered_kwargs = {
+    return {
         k: kwargs.get(k) for k in [
             'query', 'autocomplete', 'bbox', 'country', 'language', 'limit', 'proximity', 'types', 'worldview', 'url',
             *STRUCTURED_ADDRESS_KWARGS
         ]
     }
-    return kwargs_hasher(**filtered_kwargs)
+
+
+def mapbox_geocode_parameters_hasher(*args, **kwargs):
+    return canonical_hasher(**get_mapbox_geocode_parameters(*args, **kwargs))
+
+
+def legacy_mapbox_geocode_parameters_hasher(*args, **kwargs):
+    return kwargs_hasher(**get_mapbox_geocode_parameters(*args, **kwargs))
 
 
 _next_request_time = datetime.now()
+# keyword arguments forced onto every mapbox_geocode call made through geocode_address, e.g. to point it at a local
+# stand-in server; see override_mapbox_requests
+_mapbox_request_overrides = {}
 
 
-@FileCachedFunction.decorate('./mapbox_geocode_cache/', parameter_hasher=mapbox_geocode_parameters_hasher)
+@contextmanager
+def override_mapbox_requests(**kwargs):
+    previous_overrides = dict(_mapbox_request_overrides)
+    _mapbox_request_overrides.update(kwargs)
+    try:
+        yield
+    finally:
+        _mapbox_request_overrides.clear()
+        _mapbox_request_overrides.update(previous_overrides)
+
+
+@FileCachedFunction.decorate('./mapbox_geocode_cache/', parameter_hasher=mapbox_geocode_parameters_hasher,
+                             legacy_parameter_hasher=legacy_mapbox_geocode_parameters_hasher)
 def mapbox_geocode(access_token: str = None, query: str = None, address_number: str = None, street: str = None,
                    block: str = None, place: str = None, region: str = None, postcode: str = None,
                    locality: str = None, neighborhood: str = None, country: str = None,
@@ -71,8 +95,9 @@ def mapbox_geocode(access_token: str = None, query: str = None, address_number:
         access_token = get_mapbox_api_token()
 
     global _next_request_time
-    while datetime.now() < _next_request_time:
-        time.sleep((_next_request_time - datetime.now()).seconds)
+    with profile_span('mapbox_geocode.rate_limit_wait'):
+        while datetime.now() < _next_request_time:
+            time.sleep((_next_request_time - datetime.now()).seconds)
     if request_delay_seconds is None:
         request_delay_seconds = get_mapbox_rate_limit()
     if request_delay_seconds > 0:
@@ -92,14 +117,19 @@ def mapbox_geocode(access_token: str = None, query: str = None, address_number:
         limit=limit, proxy=proximity, types=types, worldview=worldview
     )
 
-    with requests.get(url, params=parameters) as response:
-        assert response.ok, f'Request not okay: {response.text}'
-        result = response.json()
-        return result
+    with profile_span('mapbox_geocode.http', url=url):
+        with requests.get(url, params=parameters) as response:
+            assert response.ok, f'Request not okay: {response.text}'
+            result = response.json()
+            return result
 
 bounding_box_type = typing.Optional[typing.Tuple[float, float, float, float]]
 
 
+class AmbiguousGeocodeError(AssertionError):
+    pass
+
+
 @FileCachedFunction.decorate('./manual_address_selections_cache/')
 def manually_choose_geocode(address: str, results: list, comment: str = '', bounding_box: bounding_box_type = None) -> list:
     while len(results) > 1:
@@ -150,6 +180,7 @@ def geocode_address(address: typing.Union[str, dict], comment: str = None, inter
         raise ValueError(f'Address must be a string query or a dictionary with keys: {STRUCTURED_ADDRESS_KWARGS}.')
     if bounding_box is not None:
         kwargs['bbox'] = bounding_box
+    kwargs.update(_mapbox_request_overrides)
     response = mapbox_geocode(**kwargs)
     assert isinstance(response, dict) and isinstance(response.get('features'),
                                                      list), f'Could not determine features from response: {response}'
@@ -179,19 +210,25 @@ def geocode_address(address: typing.Union[str, dict], comment: str = None, inter
         if 0 < len(keep_only_high_results) < len(results):
             print('Dropping matches with less than high confidence.')
             results = keep_only_high_results
-    if interactive and len(results) > 1:
+    if len(results) > 1:
         if isinstance(address, dict):
             address_str = ''
             for k in sorted(address.keys()):
                 address_str += f'{k}={address[k]},'
         else:
             address_str = str(address)
-        results = manually_choose_geocode(address_str, results, comment, bounding_box=bounding_box)
+        # a choice made in an earlier run is reused even when prompting is not allowed
+        if interactive or manually_choose_geocode.find_key(address_str, results, comment,
+                                                           bounding_box=bounding_box)[1] is not None:
+            results = manually_choose_geocode(address_str, results, comment, bounding_box=bounding_box)
+    if len(results) > 1:
+        raise AmbiguousGeocodeError(f'Found {len(results)} matches for {address}.')
     assert len(results) == 1, f'Failed to reduce results to 1 for {address}.'
     return results[0]
 
 
 def main():
+    import pandas as pd
     arg_parser = ArgumentParser()
     arg_parser.add_argument('--input-file', type=str, default='',
                             help='Input csv file of addresses to geocode.')
@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from typing import Callable
+
+
+class Profiler:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now()
+            self._start_time = time.perf_counter()
+            self.spans = []
+            self.counters = defaultdict(int)
+
+    @contextmanager
+    def span(self, name: str, **args):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.spans.append(dict(
+                    name=name, start=start - self._start_time, duration=end - start,
+                    thread=threading.get_ident(), args={k: str(v) for k, v in args.items()}
+                ))
+
+    def count(self, name: str, value: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] += value
+
+    def summary(self) -> dict:
+        results = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            durations = results.setdefault(span['name'], [])
+            durations.append(span['duration'])
+        for name, durations in results.items():
+            results[name] = dict(
+                count=len(durations), total_seconds=sum(durations), mean_seconds=sum(durations) / len(durations),
+                min_seconds=min(durations), max_seconds=max(durations)
+            )
+        return results
+
+    def report(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+        return dict(
+            started_at=self.started_at.isoformat(),
+            wall_seconds=time.perf_counter() - self._start_time,
+            summary=self.summary(),
+            counters=counters,
+            spans=spans,
+        )
+
+    def save_report(self, file_path: str):
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(file_path, 'wt') as out_file:
+            json.dump(self.report(), out_file, indent=4, sort_keys=True)
+        print(f'Saved profiling report to {file_path}')
+
+    def chrome_trace(self) -> dict:
+        # https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+        events = []
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+        for span in spans:
+            events.append(dict(
+                name=span['name'], ph='X', pid=pid, tid=span['thread'], ts=span['start'] * 1e6,
+                dur=span['duration'] * 1e6, args=span['args']
+            ))
+        if counters:
+            events.append(dict(name='counters', ph='C', pid=pid, tid=0,
+                               ts=(time.perf_counter() - self._start_time) * 1e6, args=counters))
+        return dict(traceEvents=events, displayTimeUnit='ms')
+
+    def save_chrome_trace(self, file_path: str):
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(file_path, 'wt') as out_file:
+            json.dump(self.chrome_trace(), out_file)
+        print(f'Saved Chrome trace to {file_path}')
+
+
+_profiler = Profiler()
+
+
+def get_profiler() -> Profiler:
+    return _profiler
+
+
+def enable_profiling(enabled: bool = True) -> Profiler:
+    _profiler.enabled = enabled
+    if enabled:
+        _profiler.reset()
+    return _profiler
+
+
+@contextmanager
+def profiling_session(enabled: bool, report_file: str, chrome_trace_file: str = ''):
+    # the reports are written even when the run fails, since a failing run is often the one worth profiling
+    profiler = enable_profiling(enabled)
+    try:
+        yield profiler
+    finally:
+        if enabled:
+            profiler.save_report(report_file)
+            if chrome_trace_file:
+                profiler.save_chrome_trace(chrome_trace_file)
+
+
+def profile_span(name: str, **args):
+    return _profiler.span(name, **args)
+
+
+def profile_count(name: str, value: int = 1):
+    _profiler.count(name, value)
+
+
+def profiled(name: str = None) -> Callable:
+    def decorator(function):
+        span_name = name or function.__name__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with _profiler.span(span_name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,284 @@
+import html
+import json
+import os
+import threading
+import time
+import typing
+from contextlib import contextmanager
+from hashlib import sha512
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, parse_qsl, quote, urlencode
+
+import requests
+
+from fetch_voting_locations.utils.mapbox_geocode import mapbox_geocode, override_mapbox_requests, \
+    get_mapbox_api_token
+
+MAPBOX_FORWARD_PATH = '/search/geocode/v6/forward'
+MAPBOX_BATCH_PATH = '/search/geocode/v6/batch'
+SOS_LOCATIONS_PATH = '/s/advanced-voting-location-information'
+# parameters which do not change the geocoding answer and so are left out of fixture keys
+IGNORED_MAPBOX_PARAMETERS = {'access_token', 'permanent', 'format'}
+DEFAULT_SYNTHETIC_BOUNDS = (-85.6, 30.4, -80.8, 35.0)
+
+SOS_PROPERTY_LABELS = [
+    ('County', 'county'),
+    ('Election', 'election'),
+    ('LOCATION NAME', 'name'),
+    ('LOCATION ADDRESS', 'address'),
+    ('LOCATION HOURS OF OPERATION', 'schedule'),
+]
+
+
+def mapbox_fixture_key(parameters: dict) -> str:
+    canonical = []
+    for key in sorted(parameters.keys()):
+        if key in IGNORED_MAPBOX_PARAMETERS:
+            continue
+        value = parameters[key]
+        if isinstance(value, (list, tuple)):
+            value = ','.join(map(str, value))
+        canonical.append(f'{key}={value}')
+    return sha512('&'.join(canonical).encode('utf-8')).hexdigest()
+
+
+def synthetic_mapbox_response(parameters: dict) -> dict:
+    key = mapbox_fixture_key(parameters)
+    bbox = parameters.get('bbox')
+    if isinstance(bbox, str):
+        bbox = bbox.split(',')
+    if isinstance(bbox, (list, tuple)) and len(bbox) == 4:
+        bbox = tuple(map(float, bbox))
+    else:
+        bbox = DEFAULT_SYNTHETIC_BOUNDS
+    x_fraction = int(key[:8], 16) / 0xffffffff
+    y_fraction = int(key[8:16], 16) / 0xffffffff
+    lng = bbox[0] + (bbox[2] - bbox[0]) * x_fraction
+    lat = bbox[1] + (bbox[3] - bbox[1]) * y_fraction
+    full_address = parameters.get('q')
+    if not full_address:
+        full_address = ', '.join(str(parameters[k]) for k in [
+            'address_number', 'street', 'place', 'region', 'postcode'] if parameters.get(k))
+    return dict(type='FeatureCollection', features=[dict(
+        type='Feature',
+        geometry=dict(type='Point', coordinates=[lng, lat]),
+        properties=dict(full_address=full_address, match_code=dict(confidence='exact', postcode='matched'))
+    )])
+
+
+def render_sos_results_page(locations: typing.List[dict], next_page_href: typing.Optional[str]) -> str:
+    cards = []
+    for location in locations:
+        rows = []
+        for label, property_name in SOS_PROPERTY_LABELS:
+            value = location.get(property_name, '')
+            values = value if isinstance(value, list) else [value]
+            value_elements = ''.join(
+                f'<div>{"<br>".join(map(html.escape, str(v).split(chr(10))))}</div>' for v in values)
+            rows.append(f'<div><span class="text-muted">{html.escape(label)}</span>{value_elements}</div>')
+        rows.append('<div><button class="slds-button">DIRECTIONS TO POLLING PLACE</button></div>')
+        cards.append(f'<div class="slds-card">{"".join(rows)}</div>')
+    if next_page_href is None:
+        next_button = '<button class="slds-button" aria-disabled="true">NEXT</button>'
+    else:
+        next_button = (f'<button class="slds-button" aria-disabled="false" '
+                       f'onclick="window.location.href=\'{html.escape(next_page_href)}\'">NEXT</button>')
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Polling Places</title></head><body>'
+        f'<c-vr-wi-adv-polling-place-result>{"".join(cards)}</c-vr-wi-adv-polling-place-result>'
+        '<button class="slds-button" aria-disabled="false" onclick="window.history.back()">BACK</button>'
+        f'{next_button}</body></html>'
+    )
+
+
+def write_sos_fixture_pages(locations: typing.List[dict], fixture_directory: str, election_id: str, county: str,
+                            page_size: int = 10) -> typing.List[str]:
+    county_directory = os.path.join(fixture_directory, 'sos', election_id, county)
+    os.makedirs(county_directory, exist_ok=True)
+    pages = [locations[i:i + page_size] for i in range(0, len(locations), page_size)] or [[]]
+    file_paths = []
+    for i, page_locations in enumerate(pages):
+        next_page_href = f'page-{i + 2}.html' if i + 1 < len(pages) else None
+        file_path = os.path.join(county_directory, f'page-{i + 1}.html')
+        with open(file_path, 'wt') as out_file:
+            out_file.write(render_sos_results_page(page_locations, next_page_href))
+        file_paths.append(file_path)
+    return file_paths
+
+
+def get_sos_fixture_file_url(fixture_directory: str) -> str:
+    # a base url the scraper can load the fixture pages from without a server, see get_sos_locations_url
+    return f'file://{quote(os.path.abspath(fixture_directory))}'
+
+
+def write_sos_fixtures_for_election(election_directory: str, fixture_directory: str, page_size: int = 10) -> dict:
+    election_id = os.path.basename(os.path.normpath(election_directory))
+    with open(os.path.join(election_directory, 'counties.json'), 'rt') as in_file:
+        counties = json.load(in_file)
+    results = {}
+    for county in counties:
+        county_file = os.path.join(election_directory, 'json', f'{county}.json')
+        if not os.path.isfile(county_file):
+            continue
+        with open(county_file, 'rt') as in_file:
+            locations = json.load(in_file)
+        results[county] = write_sos_fixture_pages(locations, fixture_directory, election_id, county, page_size)
+    print(f'Wrote SOS fixture pages for {len(results)} counties of election {election_id}.')
+    return results
+
+
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    server: 'ReplayServer'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes, content_type: str = 'application/json', headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data, status: int = 200):
+        self._send(status, json.dumps(data).encode('utf-8'))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parameters = {k: v[0] if len(v) == 1 else v for k, v in parse_qs(url.query).items()}
+        if url.path == MAPBOX_FORWARD_PATH:
+            time.sleep(self.server.geocode_latency_seconds)
+            response = self.server.geocode(parameters, self.path)
+            if response is None:
+                self._send_json(dict(message='No recorded response'), status=404)
+            else:
+                self._send_json(response)
+        elif url.path == SOS_LOCATIONS_PATH:
+            election_id = quote(parameters.get('election', ''))
+            county = quote(parameters.get('countyName', ''))
+            self._send(302, b'', headers=dict(Location=f'/sos/{election_id}/{county}/page-1.html'))
+        elif url.path.startswith('/sos/'):
+            time.sleep(self.server.page_latency_seconds)
+            file_path = os.path.normpath(os.path.join(self.server.fixture_directory, url.path.lstrip('/')))
+            fixture_directory = self.server.fixture_directory
+            if os.path.commonpath([file_path, fixture_directory]) != fixture_directory or \
+                    not os.path.isfile(file_path):
+                self._send(404, b'Not found', content_type='text/plain')
+                return
+            with open(file_path, 'rb') as in_file:
+                self._send(200, in_file.read(), content_type='text/html; charset=utf-8')
+        else:
+            self._send(404, b'Not found', content_type='text/plain')
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != MAPBOX_BATCH_PATH:
+            self._send(404, b'Not found', content_type='text/plain')
+            return
+        queries = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'[]')
+        time.sleep(self.server.geocode_latency_seconds)
+        batch = []
+        for query in queries:
+            response = self.server.geocode(query)
+            batch.append(response if response is not None else dict(type='FeatureCollection', features=[]))
+        self._send_json(dict(batch=batch))
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fixture_directory: str = 'replay_fixtures', host: str = '127.0.0.1', port: int = 0,
+                 geocode_latency_seconds: float = 0.0, page_latency_seconds: float = 0.0,
+                 record_url: str = None, synthesize_missing: bool = True, verbose: bool = False,
+                 record_access_token: str = None):
+        super().__init__((host, port), ReplayRequestHandler)
+        self.fixture_directory = os.path.abspath(fixture_directory)
+        self.geocode_latency_seconds = geocode_latency_seconds
+        self.page_latency_seconds = page_latency_seconds
+        self.record_url = record_url
+        # clients are pointed here with a placeholder token, so recording swaps in the real one
+        self.record_access_token = record_access_token
+        self.synthesize_missing = synthesize_missing
+        self.verbose = verbose
+        self.requests_served = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def mapbox_forward_url(self) -> str:
+        return f'{self.url}{MAPBOX_FORWARD_PATH}'
+
+    @property
+    def sos_locations_url(self) -> str:
+        return f'{self.url}{SOS_LOCATIONS_PATH}'
+
+    def _get_fixture_file(self, key: str) -> str:
+        return os.path.join(self.fixture_directory, 'mapbox', f'{key}.json')
+
+    def get_record_url(self, path: str) -> str:
+        url = urlparse(path)
+        query = [(k, v) for k, v in parse_qsl(url.query, keep_blank_values=True) if k != 'access_token']
+        query.append(('access_token', self.record_access_token or get_mapbox_api_token()))
+        return f'{self.record_url.rstrip("/")}{url.path}?{urlencode(query)}'
+
+    def geocode(self, parameters: dict, path: str = None) -> typing.Optional[dict]:
+        with self._lock:
+            self.requests_served += 1
+        fixture_file = self._get_fixture_file(mapbox_fixture_key(parameters))
+        if os.path.isfile(fixture_file):
+            with open(fixture_file, 'rt') as in_file:
+                return json.load(in_file)
+        if self.record_url and path is not None:
+            with requests.get(self.get_record_url(path)) as response:
+                if not response.ok:
+                    print(f'Failed to record MapBox response: {response.text}')
+                    return None
+                result = response.json()
+            os.makedirs(os.path.dirname(fixture_file), exist_ok=True)
+            with open(fixture_file, 'wt') as out_file:
+                json.dump(result, out_file, indent=4, sort_keys=True)
+            return result
+        if self.synthesize_missing:
+            return synthetic_mapbox_response(parameters)
+        return None
+
+    def start(self) -> 'ReplayServer':
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        print(f'Replay server listening on {self.url}')
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+@contextmanager
+def replay_mapbox_geocoding(server: ReplayServer, cache_directory: str):
+    # keep replayed responses out of the real geocode cache
+    previous_cache_directory, previous_cache = mapbox_geocode.cache_directory, mapbox_geocode._cache
+    mapbox_geocode.cache_directory = os.path.abspath(cache_directory)
+    mapbox_geocode._cache = {}
+    try:
+        with override_mapbox_requests(url=server.mapbox_forward_url, access_token='replay',
+                                      request_delay_seconds=0):
+            yield
+    finally:
+        mapbox_geocode.cache_directory, mapbox_geocode._cache = previous_cache_directory, previous_cache
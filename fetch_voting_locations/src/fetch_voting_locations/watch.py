@@ -0,0 +1,394 @@
+import datetime
+import json
+import os
+import threading
+import time
+import typing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+from selenium.common import WebDriverException
+
+from fetch_voting_locations.geocoding import collect_known_geocodes, apply_known_geocodes, get_location_identity, \
+    geocode_and_save_county
+from fetch_voting_locations.geospatial import write_county_geojson, write_all_counties_geojson, \
+    spatially_check_polling_places
+from fetch_voting_locations.location_files import ALL_LOCATIONS_ID, load_counties, load_county_voting_locations, \
+    save_county_voting_locations, save_all_county_voting_locations, load_aggregated_voting_locations
+from fetch_voting_locations.location_store import get_location_store, update_location_store
+from fetch_voting_locations.progress import ProgressManifest, SCRAPED, EXPORTED, FAILED
+from fetch_voting_locations.scenarios import refresh_voting_location_subsets
+from fetch_voting_locations.scrape import fetch_early_voting_location_pages, reset_driver, SOS_LOCATIONS_URL
+from fetch_voting_locations.utils.profiling import profiled, profile_span, profile_count
+
+HEALTH_PATH = '/health'
+METRICS_PATH = '/metrics'
+DEFAULT_INTERVAL_MINUTES = 60
+DEFAULT_MAX_COUNTIES_PER_CYCLE = 20
+# counties whose polling places changed this recently are checked more often
+RECENT_CHANGE_SECONDS = 24 * 60 * 60
+# the watch wakes up at least this often, so a stop request never waits for a whole interval
+MAX_SLEEP_SECONDS = 300
+# the columns that end up in the derived outputs; a change in any of them means the days it is open are rebuilt
+CHANGE_COLUMNS = ['county_key', 'county_index', 'name', 'address', 'lat', 'lng']
+
+
+def parse_timestamp(timestamp: typing.Optional[str]) -> float:
+    if not timestamp:
+        return 0.0
+    try:
+        return datetime.datetime.fromisoformat(timestamp).timestamp()
+    except ValueError:
+        return 0.0
+
+
+class CountySchedule:
+    def __init__(self, counties: typing.List[str], all_locations: dict, manifest: ProgressManifest,
+                 interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        # the last scrape recorded by earlier runs, so a restarted watch does not re-scrape the whole state at once
+        self.last_scraped = {county: parse_timestamp(manifest.counties.get(county, {}).get('scraped_at'))
+                             for county in counties}
+        self.last_changed = {}
+        self.location_counts = {county: len(all_locations.get(county) or []) for county in counties}
+
+    def get_interval(self, county: str, now: float) -> float:
+        # the largest counties are checked twice as often, and once more as often again after a recent change
+        weight = 1 + self.location_counts.get(county, 0) / max(max(self.location_counts.values(), default=0), 1)
+        if now - self.last_changed.get(county, -np.inf) <= RECENT_CHANGE_SECONDS:
+            weight += 1
+        return self.interval_seconds / weight
+
+    def get_due_counties(self, now: float, limit: int = None) -> typing.List[str]:
+        overdue = {county: (now - last_scraped) / self.get_interval(county, now)
+                   for county, last_scraped in self.last_scraped.items()}
+        due_counties = sorted((county for county, ratio in overdue.items() if ratio >= 1),
+                              key=lambda county: -overdue[county])
+        return due_counties[:limit] if limit else due_counties
+
+    def get_seconds_until_due(self, now: float) -> float:
+        if len(self.last_scraped) == 0:
+            return self.interval_seconds
+        return max(0.0, min(last_scraped + self.get_interval(county, now) - now
+                            for county, last_scraped in self.last_scraped.items()))
+
+    def record(self, county: str, now: float, locations: typing.Optional[typing.List[dict]] = None):
+        self.last_scraped[county] = now
+        if locations is not None:
+            self.last_changed[county] = now
+            self.location_counts[county] = len(locations)
+
+
+class WatchStatus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.counters = dict(cycles=0, counties_scraped=0, counties_changed=0, counties_failed=0,
+                             locations_scraped=0, days_rebuilt=0)
+        self.scrape_seconds = 0.0
+        self.rebuild_seconds = 0.0
+        self.last_cycle = None
+        self.last_error = None
+        self.next_cycle_at = None
+        # county -> names of polling places left ungeocoded because MapBox returned several matches
+        self.deferred_geocodes = {}
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def add_seconds(self, name: str, seconds: float):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + seconds)
+
+    def set_deferred_geocodes(self, county: str, deferred_locations: typing.List[dict]):
+        with self._lock:
+            if len(deferred_locations) > 0:
+                self.deferred_geocodes[county] = [location.get('name') for location in deferred_locations]
+            else:
+                self.deferred_geocodes.pop(county, None)
+
+    def finish_cycle(self, cycle: dict, error: Exception = None, next_cycle_at: float = None):
+        with self._lock:
+            self.counters['cycles'] += 1
+            self.last_cycle = cycle
+            self.last_error = None if error is None else str(error)
+            self.next_cycle_at = next_cycle_at
+
+    def get_state(self) -> str:
+        if self.last_cycle is None:
+            return 'starting'
+        if self.last_error is not None:
+            return 'failing'
+        if len(self.last_cycle.get('failed_counties', [])) > 0 or len(self.deferred_geocodes) > 0:
+            return 'degraded'
+        return 'ok'
+
+    def health(self) -> dict:
+        with self._lock:
+            return dict(status=self.get_state(), uptime_seconds=round(time.time() - self.started_at, 1),
+                        last_cycle=self.last_cycle, last_error=self.last_error,
+                        next_cycle_at=format_timestamp(self.next_cycle_at),
+                        deferred_geocodes=dict(self.deferred_geocodes))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            scrape_hours = self.scrape_seconds / 3600
+            return dict(
+                self.counters,
+                uptime_seconds=round(time.time() - self.started_at, 1),
+                scrape_seconds=round(self.scrape_seconds, 1),
+                rebuild_seconds=round(self.rebuild_seconds, 1),
+                counties_per_hour=round(self.counters['counties_scraped'] / scrape_hours, 1) if scrape_hours else None,
+                locations_per_hour=(round(self.counters['locations_scraped'] / scrape_hours, 1) if scrape_hours
+                                    else None),
+                deferred_geocodes=sum(len(names) for names in self.deferred_geocodes.values()),
+            )
+
+
+def format_timestamp(timestamp: typing.Optional[float]) -> typing.Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(timespec='seconds')
+
+
+def get_locations_fingerprint(locations: typing.List[dict]) -> list:
+    # scraped addresses are rewritten by geocoding, so compare on the normalized identity and the schedule only
+    return sorted((get_location_identity(location), tuple(location.get('schedule') or [])) for location in locations)
+
+
+def rescrape_county(election_id: str, county: str, output_directory: str, known_geocodes: dict,
+                    manifest: ProgressManifest, base_url: str = SOS_LOCATIONS_URL,
+                    deferred_locations: typing.List[dict] = None
+                    ) -> typing.Tuple[int, typing.Optional[typing.List[dict]]]:
+    # returns the number of scraped locations and the county's geocoded locations when they changed, otherwise None;
+    # nobody is around to choose between several matches, so those locations are left in deferred_locations
+    previous_locations = load_county_voting_locations(output_directory, county) or []
+    try:
+        locations, pages = fetch_early_voting_location_pages(election_id, county, base_url)
+        if len(locations) == 0 and len(previous_locations) > 0:
+            raise RuntimeError(f'No locations found for county {county}, keeping its {len(previous_locations)} '
+                               f'previous locations')
+    except Exception as e:
+        manifest.fail(county, 'scrape', e)
+        if isinstance(e, WebDriverException):
+            reset_driver()
+        raise
+    if get_locations_fingerprint(locations) == get_locations_fingerprint(previous_locations):
+        if manifest.get_state(county) == FAILED:
+            # the outputs built from the previous scrape are still current
+            manifest.update(county, EXPORTED, locations=len(locations))
+        return len(locations), None
+    save_county_voting_locations(output_directory, county, locations)
+    manifest.update(county, SCRAPED, pages=pages, locations=len(locations))
+    # polling places that were already known keep their geocodes, so only new addresses reach MapBox
+    apply_known_geocodes(locations, collect_known_geocodes({county: previous_locations}))
+    return len(locations), geocode_and_save_county(county, locations, output_directory, known_geocodes, manifest,
+                                                   interactive=False, deferred_locations=deferred_locations)
+
+
+def get_changed_location_ids(previous_locations, locations) -> np.ndarray:
+    previous_rows = list(zip(*(previous_locations[column].to_pylist() for column in CHANGE_COLUMNS)))
+    rows = list(zip(*(locations[column].to_pylist() for column in CHANGE_COLUMNS)))
+    return np.asarray([location_id for location_id, row in enumerate(rows)
+                       if location_id >= len(previous_rows) or row != previous_rows[location_id]], dtype=np.int64)
+
+
+def get_affected_days(scenarios: dict, changed_days: typing.Dict[str, typing.Set[str]],
+                      changed_location_ids: np.ndarray) -> typing.Dict[str, typing.Set[str]]:
+    # a day is rebuilt when its open polling places changed, or when one of them moved or was renamed
+    affected_days = {}
+    for scenario_name, scenario in scenarios.items():
+        affected_days[scenario_name] = set(changed_days.get(scenario_name, ()))
+        for day, open_polls in scenario.get('times', {}).items():
+            if np.isin(open_polls.get(ALL_LOCATIONS_ID, []), changed_location_ids).any():
+                affected_days[scenario_name].add(day)
+    return affected_days
+
+
+class ElectionWatcher:
+    def __init__(self, election_id: str, scenarios_file_path: str, state: str = 'Georgia',
+                 output_directory: str = 'data', interval_minutes: float = DEFAULT_INTERVAL_MINUTES,
+                 max_counties_per_cycle: int = DEFAULT_MAX_COUNTIES_PER_CYCLE, publish_outputs: bool = True,
+                 base_url: str = SOS_LOCATIONS_URL, nearest_outputs: bool = False, cluster_outputs: bool = False,
+                 coverage_outputs: bool = False):
+        self.election_id = election_id
+        self.scenarios_file_path = scenarios_file_path
+        self.state = state
+        self.data_directory = output_directory
+        self.output_directory = os.path.join(output_directory, election_id)
+        self.max_counties_per_cycle = max_counties_per_cycle
+        self.publish_outputs = publish_outputs
+        self.nearest_outputs = nearest_outputs
+        self.cluster_outputs = cluster_outputs
+        self.coverage_outputs = coverage_outputs
+        self.base_url = base_url
+        self.status = WatchStatus()
+        self.stop_event = threading.Event()
+        # everything below stays resident between cycles instead of being reloaded by every run
+        self.counties = load_counties(self.output_directory)
+        self.manifest = ProgressManifest(self.output_directory)
+        self.all_locations = load_aggregated_voting_locations(self.output_directory)
+        self.all_locations.pop(ALL_LOCATIONS_ID, None)
+        self.known_geocodes = collect_known_geocodes(self.all_locations)
+        self.location_store = get_location_store(self.output_directory)
+        self.schedule = CountySchedule(self.counties, self.all_locations, self.manifest, interval_minutes * 60)
+
+    def load_scenarios(self) -> dict:
+        with open(self.scenarios_file_path, 'rt') as in_file:
+            return json.load(in_file)
+
+    def scrape_due_counties(self, counties: typing.List[str]) -> typing.Tuple[dict, typing.List[str]]:
+        changed_counties = {}
+        failed_counties = []
+        for county in counties:
+            started = time.time()
+            deferred_locations = []
+            try:
+                with profile_span('watch.rescrape_county', county=county):
+                    location_count, locations = rescrape_county(self.election_id, county, self.output_directory,
+                                                                self.known_geocodes, self.manifest, self.base_url,
+                                                                deferred_locations)
+            except Exception as e:
+                print(f'Failed to re-scrape county {county} due to exception: {e}')
+                failed_counties.append(county)
+                self.status.count('counties_failed')
+                # failed counties wait a full interval like the others, rather than being retried in a tight loop
+                self.schedule.record(county, time.time())
+                continue
+            finally:
+                self.status.add_seconds('scrape_seconds', time.time() - started)
+            self.schedule.record(county, time.time(), locations)
+            self.status.count('counties_scraped')
+            self.status.count('locations_scraped', location_count)
+            profile_count('watch.counties_scraped')
+            if locations is not None:
+                print(f'Polling places changed for county {county}.')
+                self.status.set_deferred_geocodes(county, deferred_locations)
+                if len(deferred_locations) > 0:
+                    print(f'{len(deferred_locations)} polling places in {county} have several matches; run the '
+                          f'geocode command to choose between them.')
+                changed_counties[county] = locations
+                collect_known_geocodes({county: locations}, self.known_geocodes)
+                self.status.count('counties_changed')
+        return changed_counties, failed_counties
+
+    @profiled()
+    def rebuild_outputs(self, changed_counties: dict) -> typing.Dict[str, typing.Set[str]]:
+        self.all_locations.update(changed_counties)
+        save_all_county_voting_locations(self.output_directory, self.all_locations)
+        previous_locations = self.location_store.locations
+        self.location_store = update_location_store(self.output_directory, self.all_locations, self.counties)
+        for county, locations in changed_counties.items():
+            write_county_geojson(locations, county, self.output_directory)
+        write_all_counties_geojson(self.location_store, self.output_directory)
+        scenarios, changed_days = refresh_voting_location_subsets(
+            self.location_store, self.load_scenarios(), os.path.join(self.output_directory, 'scenarios'))
+        days = get_affected_days(scenarios, changed_days,
+                                 get_changed_location_ids(previous_locations, self.location_store.locations))
+        locations = self.location_store.locations
+        if self.nearest_outputs:
+            from fetch_voting_locations.nearest import NearestOpenLocationIndex, export_nearest_open_locations
+            export_nearest_open_locations(NearestOpenLocationIndex(locations, scenarios), self.output_directory,
+                                          days=days)
+        if self.cluster_outputs:
+            from fetch_voting_locations.clusters import export_marker_clusters
+            export_marker_clusters(locations, scenarios, self.output_directory, days=days)
+        if self.coverage_outputs:
+            from fetch_voting_locations.coverage import export_coverage_analysis
+            export_coverage_analysis(locations, scenarios, self.output_directory, state=self.state, days=days)
+        spatially_check_polling_places(output_directory=self.output_directory, state=self.state,
+                                       counties=list(changed_counties))
+        self.manifest.mark_counties(list(changed_counties), EXPORTED)
+        if self.publish_outputs:
+            from fetch_voting_locations.publish import publish
+            publish([self.output_directory], self.data_directory)
+        return days
+
+    def run_cycle(self) -> dict:
+        started = time.time()
+        counties = self.schedule.get_due_counties(started, self.max_counties_per_cycle)
+        cycle = dict(started_at=format_timestamp(started), counties=counties)
+        error = None
+        try:
+            changed_counties, cycle['failed_counties'] = self.scrape_due_counties(counties)
+            cycle['changed_counties'] = list(changed_counties)
+            if len(changed_counties) > 0:
+                rebuild_started = time.time()
+                try:
+                    days = self.rebuild_outputs(changed_counties)
+                finally:
+                    self.status.add_seconds('rebuild_seconds', time.time() - rebuild_started)
+                cycle['rebuilt_days'] = sum(len(scenario_days) for scenario_days in days.values())
+                self.status.count('days_rebuilt', cycle['rebuilt_days'])
+        except Exception as e:
+            print(f'Watch cycle failed due to exception: {e}')
+            error = e
+        cycle['seconds'] = round(time.time() - started, 1)
+        self.status.finish_cycle(cycle, error, time.time() + self.schedule.get_seconds_until_due(time.time()))
+        print(f'Checked {len(counties)} counties in {cycle["seconds"]} seconds, '
+              f'{len(cycle.get("changed_counties", []))} changed.')
+        return cycle
+
+    def run(self, cycles: int = 0):
+        # cycles of 0 keeps watching until stop() is called or the process is interrupted
+        completed_cycles = 0
+        while not self.stop_event.is_set():
+            if len(self.schedule.get_due_counties(time.time())) > 0:
+                self.run_cycle()
+                completed_cycles += 1
+                if 0 < cycles <= completed_cycles:
+                    return
+            self.stop_event.wait(min(self.schedule.get_seconds_until_due(time.time()), MAX_SLEEP_SECONDS))
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class WatchRequestHandler(BaseHTTPRequestHandler):
+    server: 'WatchServer'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, data, status: int = 200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == HEALTH_PATH:
+            health = self.server.status.health()
+            self._send_json(health, status=503 if health['status'] == 'failing' else 200)
+        elif url.path == METRICS_PATH:
+            self._send_json(self.server.status.metrics())
+        else:
+            self._send_json(dict(message='Not found'), status=404)
+
+
+class WatchServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, status: WatchStatus, host: str = '127.0.0.1', port: int = 0, verbose: bool = False):
+        super().__init__((host, port), WatchRequestHandler)
+        self.status = status
+        self.verbose = verbose
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'WatchServer':
+        threading.Thread(target=self.serve_forever, name='watch-server', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
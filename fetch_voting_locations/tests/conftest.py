@@ -0,0 +1,25 @@
+import pytest
+
+from fetch_voting_locations.utils.mapbox_geocode import manually_choose_geocode
+from fetch_voting_locations.utils.replay import ReplayServer
+
+
+@pytest.fixture
+def replay_server(tmp_path):
+    with ReplayServer(str(tmp_path / 'fixtures')) as server:
+        yield server
+
+
+@pytest.fixture
+def manual_selections(tmp_path, monkeypatch):
+    # keep manual choices made by tests out of the committed selection cache
+    monkeypatch.setattr(manually_choose_geocode, 'cache_directory', str(tmp_path / 'manual_address_selections_cache'))
+    monkeypatch.setattr(manually_choose_geocode, '_cache', {})
+    return manually_choose_geocode
+
+
+@pytest.fixture
+def no_county_bounding_boxes(monkeypatch):
+    # the census county file is not checked in
+    import fetch_voting_locations.geospatial
+    monkeypatch.setattr(fetch_voting_locations.geospatial, 'get_county_bounding_boxes', lambda *args, **kwargs: {})
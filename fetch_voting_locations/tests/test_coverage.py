@@ -0,0 +1,17 @@
+import numpy as np
+
+from fetch_voting_locations.coverage import summarize_distances
+
+
+def test_distances_are_summarized_over_reachable_cells():
+    statistics = summarize_distances(np.array([1.0, 3.0, 20.0, np.inf, np.inf]), 0.25, 10.0)
+    assert statistics['cells'] == 5 and statistics['area_square_miles'] == 1.25
+    assert statistics['unreachable_cells'] == 2 and statistics['unreachable_area_square_miles'] == 0.5
+    assert statistics['gap_area_square_miles'] == 0.75 and statistics['covered_fraction'] == 0.4
+    assert statistics['mean_distance_miles'] == 8.0 and statistics['max_distance_miles'] == 20.0
+
+
+def test_no_reachable_cells_leaves_distances_empty():
+    statistics = summarize_distances(np.full(4, np.inf), 0.25, 10.0)
+    assert statistics['unreachable_cells'] == 4 and statistics['covered_fraction'] == 0.0
+    assert statistics['mean_distance_miles'] is None and statistics['max_distance_miles'] is None
@@ -0,0 +1,57 @@
+import pytest
+
+from fetch_voting_locations.utils.file_cached_function import FileCachedFunction, CacheMissError, canonical_hasher, \
+    default_hasher, is_legacy_key, track_cache_keys
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def cached_function(tmp_path, calls):
+    def count_calls(*args, **kwargs):
+        calls.append((args, kwargs))
+        return len(calls)
+
+    return FileCachedFunction(count_calls, str(tmp_path / 'cache'))
+
+
+def test_canonical_keys_ignore_keyword_order():
+    assert canonical_hasher(bar='baz', qux=1) == canonical_hasher(qux=1, bar='baz')
+    assert canonical_hasher('foo', bar='baz') != canonical_hasher('foo', bar='qux')
+
+
+def test_legacy_entries_are_found_under_the_old_key(cached_function, calls):
+    key = cached_function.get_key('foo', bar='baz')
+    legacy_key = default_hasher('foo', bar='baz')
+    assert key != legacy_key and not is_legacy_key(key) and is_legacy_key(legacy_key)
+
+    cached_function._save_cache_file(cached_function._get_cache_file(legacy_key), 'legacy')
+    assert cached_function.find_key('foo', bar='baz') == (key, legacy_key)
+    assert cached_function('foo', bar='baz') == 'legacy' and len(calls) == 0
+
+    cached_function._save_cache(key, 'current')
+    assert cached_function.find_key('foo', bar='baz') == (key, key)
+    assert cached_function('foo', bar='baz') == 'current'
+
+
+def test_tracking_keys_never_calls_the_function(cached_function, calls):
+    key = cached_function.get_key('foo', bar='baz')
+    legacy_key = default_hasher('foo', bar='baz')
+    cached_function._save_cache_file(cached_function._get_cache_file(legacy_key), 'legacy')
+    with track_cache_keys(cached_function) as (tracked_keys,):
+        cached_function('foo', bar='baz')
+        with pytest.raises(CacheMissError):
+            cached_function('qux')
+    assert len(calls) == 0 and not cached_function.offline
+    assert tracked_keys == {key: legacy_key, cached_function.get_key('qux'): None}
+
+
+def test_clearing_the_cache_calls_the_function_again(cached_function, calls):
+    assert cached_function('foo', bar='baz') == 1
+    assert cached_function('foo', bar='baz') == 1 and len(calls) == 1
+    cached_function.clear_cache('foo', bar='baz')
+    assert cached_function.get_cache_files() == {}
+    assert cached_function('foo', bar='baz') == 2 and len(calls) == 2
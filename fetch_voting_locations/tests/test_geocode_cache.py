@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from fetch_voting_locations.geocode_cache import CacheReferences, compact_cache, summarize_cache
+from fetch_voting_locations.utils.file_cached_function import FileCachedFunction, default_hasher, track_cache_keys
+
+
+@pytest.fixture
+def cache(tmp_path):
+    # a legacy entry still in use, one only reached without a bounding box, one no lookup reaches and two identical
+    # current entries
+    cache = FileCachedFunction(lambda **kwargs: kwargs, str(tmp_path / 'cache'))
+
+    def store(key: str, value):
+        cache._save_cache_file(cache._get_cache_file(key), value)
+
+    store(default_hasher(x=1), 'legacy')
+    store(default_hasher(x=2), 'unbounded')
+    store(default_hasher(x=3), 'stale')
+    store(cache.get_key(x=4), 'duplicate')
+    store(cache.get_key(x=5), 'duplicate')
+    return cache
+
+
+@pytest.fixture
+def references(cache):
+    duplicate_keys = [cache.get_key(x=4), cache.get_key(x=5)]
+    return CacheReferences({cache.get_key(x=1): default_hasher(x=1), duplicate_keys[0]: duplicate_keys[0],
+                            duplicate_keys[1]: duplicate_keys[1], cache.get_key(x=6): None},
+                           {default_hasher(x=2)})
+
+
+def test_summary_counts_each_kind_of_entry(cache, references):
+    summary = summarize_cache(cache, references)
+    assert summary['hits'] == 3 and summary['legacy_hits'] == 1 and summary['unbounded_entries'] == 1
+    assert summary['unreferenced_entries'] == 1 and summary['duplicate_entries'] == 1
+
+
+def test_compaction_migrates_links_and_prunes(cache, references):
+    assert compact_cache(cache, references, prune=False) == dict(migrated=1, pruned=0, linked=1)
+    assert default_hasher(x=3) in cache.get_cache_files()
+    assert compact_cache(cache, references) == dict(migrated=0, pruned=1, linked=0)
+
+    duplicate_keys = [cache.get_key(x=4), cache.get_key(x=5)]
+    cache_files = cache.get_cache_files()
+    assert set(cache_files) == {cache.get_key(x=1), default_hasher(x=2), *duplicate_keys}
+    assert os.path.samefile(cache_files[duplicate_keys[0]], cache_files[duplicate_keys[1]])
+    with track_cache_keys(cache) as (keys,):
+        assert cache(x=1) == 'legacy' and cache(x=4) == cache(x=5) == 'duplicate'
+    summary = summarize_cache(cache, CacheReferences(keys, {default_hasher(x=2)}))
+    assert summary['legacy_hits'] == summary['unreferenced_entries'] == summary['duplicate_entries'] == 0
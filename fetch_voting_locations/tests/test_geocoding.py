@@ -0,0 +1,52 @@
+import copy
+
+import pytest
+
+from fetch_voting_locations.geocoding import geocode_locations
+from fetch_voting_locations.utils.mapbox_geocode import geocode_address, AmbiguousGeocodeError
+from fetch_voting_locations.utils.replay import ReplayServer, replay_mapbox_geocoding
+
+ADDRESS = '1332 METROPOLITAN PARKWAY, ATLANTA, GA, 30310'
+
+
+class AmbiguousReplayServer(ReplayServer):
+    # answers every query with two equally good matches
+    def geocode(self, parameters: dict, path: str = None):
+        response = super().geocode(parameters, path)
+        second = copy.deepcopy(response['features'][0])
+        second['geometry']['coordinates'][0] += 0.01
+        response['features'].append(second)
+        return response
+
+
+@pytest.fixture
+def ambiguous_geocoding(tmp_path, manual_selections, no_county_bounding_boxes):
+    with AmbiguousReplayServer(str(tmp_path / 'fixtures')) as server:
+        with replay_mapbox_geocoding(server, str(tmp_path / 'mapbox_geocode_cache')):
+            yield server
+
+
+def test_ambiguous_matches_are_not_prompted_for_when_not_interactive(ambiguous_geocoding, monkeypatch):
+    monkeypatch.setattr('builtins.input', lambda *args: pytest.fail('prompted for a choice'))
+    with pytest.raises(AmbiguousGeocodeError):
+        geocode_address(ADDRESS, 'comment', interactive=False)
+
+
+def test_earlier_manual_selection_is_reused_when_not_interactive(ambiguous_geocoding, monkeypatch):
+    monkeypatch.setattr('builtins.input', lambda *args: '1')
+    chosen = geocode_address(ADDRESS, 'comment', interactive=True)
+    monkeypatch.setattr('builtins.input', lambda *args: pytest.fail('prompted for a choice'))
+    assert geocode_address(ADDRESS, 'comment', interactive=False) == chosen
+
+
+def test_geocode_locations_defers_only_unresolved_choices(ambiguous_geocoding, monkeypatch):
+    locations = [dict(name='CHOSEN', address='1332 METROPOLITAN PARKWAY\nATLANTA GA 30310'),
+                 dict(name='UNCHOSEN', address='1 PEACHTREE STREET\nATLANTA GA 30303')]
+    monkeypatch.setattr('builtins.input', lambda *args: '0')
+    geocode_locations([dict(locations[0])], 'FULTON', retry_delay=0)
+    monkeypatch.setattr('builtins.input', lambda *args: pytest.fail('prompted for a choice'))
+    deferred_locations = []
+    assert geocode_locations(locations, 'FULTON', retry_delay=0, interactive=False,
+                             deferred_locations=deferred_locations)
+    assert 'lat' in locations[0] and 'lat' not in locations[1]
+    assert deferred_locations == [locations[1]]
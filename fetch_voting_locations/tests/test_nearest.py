@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pyarrow as pa
+
+from fetch_voting_locations.location_files import ALL_LOCATIONS_ID
+from fetch_voting_locations.nearest import NearestOpenLocationIndex, export_nearest_open_locations, chord_to_km, \
+    to_unit_vectors
+
+
+def get_locations(positions) -> pa.Table:
+    return pa.table({
+        'location_id': list(range(len(positions))),
+        'county_key': ['FULTON'] * len(positions),
+        'county_index': list(range(len(positions))),
+        'name': [f'Location {i}' for i in range(len(positions))],
+        'address': [f'{i} Main St' for i in range(len(positions))],
+        'lat': pa.array([lat for lat, lng in positions], pa.float64()),
+        'lng': pa.array([lng for lat, lng in positions], pa.float64()),
+    })
+
+
+def get_scenarios(location_ids) -> dict:
+    return {'any_time': {'times': {'2024-10-15': {ALL_LOCATIONS_ID: list(location_ids)}}}}
+
+
+def test_export_is_skipped_without_geocoded_locations(tmp_path):
+    index = NearestOpenLocationIndex(get_locations([(None, None), (None, None)]), get_scenarios([0, 1]))
+    assert index.get_grid()['columns'] == 0
+    assert index.query(33.75, -84.39, 'any_time', '2024-10-15') == []
+    assert export_nearest_open_locations(index, str(tmp_path)) == {}
+    assert not os.path.exists(tmp_path / 'nearest')
+
+
+def brute_force_nearest(positions, open_location_ids, lat, lng, k):
+    distances = {location_id: float(chord_to_km(np.linalg.norm(to_unit_vectors(*positions[location_id]) -
+                                                                to_unit_vectors(lat, lng))))
+                 for location_id in open_location_ids}
+    return sorted(distances, key=lambda location_id: (distances[location_id], location_id))[:k]
+
+
+def test_query_matches_brute_force_nearest():
+    rng = np.random.default_rng(0)
+    positions = list(zip(rng.uniform(30.4, 35.0, 200).tolist(), rng.uniform(-85.6, -80.8, 200).tolist()))
+    open_location_ids = sorted(rng.choice(len(positions), 120, replace=False).tolist())
+    index = NearestOpenLocationIndex(get_locations(positions), get_scenarios(open_location_ids))
+    for lat, lng in zip(rng.uniform(30, 35.5, 50).tolist(), rng.uniform(-86, -80, 50).tolist()):
+        results = index.query(lat, lng, 'any_time', '2024-10-15', k=5)
+        assert [result['location_id'] for result in results] == \
+            brute_force_nearest(positions, open_location_ids, lat, lng, 5)
+        assert [result['distance_km'] for result in results] == sorted(result['distance_km'] for result in results)
+    assert len(index.query(33.75, -84.39, 'any_time', '2024-10-15', k=500)) == len(open_location_ids)
+    assert index.query(33.75, -84.39, 'any_time', '2024-10-16') == []
+
+
+def test_cell_candidates_contain_the_nearest_open_locations():
+    rng = np.random.default_rng(1)
+    positions = list(zip(rng.uniform(33.0, 34.0, 60).tolist(), rng.uniform(-85.0, -84.0, 60).tolist()))
+    open_location_ids = list(range(0, 60, 2))
+    index = NearestOpenLocationIndex(get_locations(positions), get_scenarios(open_location_ids))
+    grid = index.get_grid(0.1)
+    cell_candidates = index.get_cell_candidates('any_time', '2024-10-15', grid, k=3)
+    assert len(cell_candidates['cells']) == grid['rows'] * grid['columns']
+    for lat, lng in zip(rng.uniform(33.0, 34.0, 200).tolist(), rng.uniform(-85.0, -84.0, 200).tolist()):
+        row = int((lat - grid['south']) // grid['cell_size_degrees'])
+        column = int((lng - grid['west']) // grid['cell_size_degrees'])
+        candidates = cell_candidates['candidates'][cell_candidates['cells'][row * grid['columns'] + column]]
+        assert set(brute_force_nearest(positions, open_location_ids, lat, lng, 3)) <= set(candidates)
@@ -0,0 +1,44 @@
+import pytest
+
+from fetch_voting_locations.progress import ProgressManifest, SCRAPED, GEOCODED, EXPORTED, raise_for_failed_counties
+
+
+def test_stages_are_only_skipped_when_resuming(tmp_path):
+    manifest = ProgressManifest(str(tmp_path))
+    manifest.update('FULTON', GEOCODED, locations=3, missing_geocodes=0)
+    assert not manifest.has_reached('FULTON', SCRAPED)
+    resumed = ProgressManifest(str(tmp_path), resume=True)
+    assert resumed.get_state('FULTON') == GEOCODED
+    assert resumed.has_reached('FULTON', SCRAPED) and resumed.has_reached('FULTON', GEOCODED)
+    assert not resumed.has_reached('FULTON', EXPORTED)
+    assert not resumed.has_reached('COBB', SCRAPED)
+
+
+def test_failure_is_recorded_and_cleared_by_the_next_stage(tmp_path):
+    manifest = ProgressManifest(str(tmp_path))
+    manifest.update('FULTON', SCRAPED, locations=3)
+    manifest.fail('FULTON', 'geocode', ValueError('MapBox is down'))
+    resumed = ProgressManifest(str(tmp_path), resume=True)
+    assert resumed.failed_counties() == ['FULTON']
+    assert resumed.counties['FULTON']['failed_stage'] == 'geocode'
+    # a failed county restarts from the beginning
+    assert not resumed.has_reached('FULTON', SCRAPED)
+    resumed.update('FULTON', GEOCODED, missing_geocodes=0)
+    assert resumed.failed_counties() == []
+    assert 'error' not in resumed.counties['FULTON'] and resumed.get_state('FULTON') == GEOCODED
+
+
+def test_missing_geocodes_are_retried_when_resuming(tmp_path):
+    manifest = ProgressManifest(str(tmp_path), resume=True)
+    manifest.update('FULTON', GEOCODED, locations=3, missing_geocodes=1)
+    manifest.mark_counties(['FULTON'], EXPORTED)
+    assert manifest.has_reached('FULTON', SCRAPED)
+    assert not manifest.has_reached('FULTON', GEOCODED)
+    manifest.update('FULTON', EXPORTED, missing_geocodes=0)
+    assert manifest.has_reached('FULTON', EXPORTED)
+
+
+def test_failed_counties_raise_with_a_resume_hint():
+    raise_for_failed_counties([])
+    with pytest.raises(RuntimeError, match='--resume'):
+        raise_for_failed_counties(['COBB', 'FULTON'])
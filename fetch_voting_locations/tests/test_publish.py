@@ -0,0 +1,53 @@
+import json
+import os
+
+from fetch_voting_locations.location_files import load_json_file
+from fetch_voting_locations.publish import PUBLISHED_PATTERNS, LAST_UPDATED_FILE, find_published_sources, publish
+
+
+def write_outputs(output_directory, relative_paths):
+    for relative_path in relative_paths:
+        file_path = os.path.join(output_directory, relative_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wt') as out_file:
+            json.dump({'file': relative_path}, out_file, indent=4)
+
+
+def test_only_site_files_are_published_by_default(tmp_path):
+    write_outputs(tmp_path, ['counties.json', 'json/FULTON.json', 'geojson/FULTON.geojson',
+                             'county_boundaries/Georgia_bounds.json', 'scenarios/scenarios.json',
+                             'scenarios/any_time/2024-10-15.json', 'nearest/nearest.json', 'coverage/coverage.json'])
+    assert find_published_sources(str(tmp_path)) == [
+        'counties.json', 'county_boundaries/Georgia_bounds.json', 'geojson/FULTON.geojson', 'json/FULTON.json',
+        'scenarios/scenarios.json']
+    assert 'nearest/nearest.json' in find_published_sources(str(tmp_path), PUBLISHED_PATTERNS + ['nearest/**/*.json'])
+
+
+def test_last_updated_is_written_to_the_data_directory_when_outputs_change(tmp_path):
+    election_directory = tmp_path / 'data' / 'election'
+    write_outputs(election_directory, ['counties.json'])
+    last_updated_file = tmp_path / 'data' / 'published' / LAST_UPDATED_FILE
+    assert publish([str(election_directory)], str(tmp_path / 'data'), brotli=False)
+    last_updated = load_json_file(str(last_updated_file))['last_updated']
+    os.remove(last_updated_file)
+    assert not publish([str(election_directory)], str(tmp_path / 'data'), brotli=False)
+    assert not os.path.exists(last_updated_file) and len(last_updated) > 0
+
+
+def test_publishing_keeps_the_current_and_previous_generations(tmp_path):
+    election_directory = tmp_path / 'data' / 'election'
+    publish_directory = election_directory / 'published'
+    write_outputs(election_directory, ['json/FULTON.json'])
+    generations = []
+    for generation in range(3):
+        with open(election_directory / 'counties.json', 'wt') as out_file:
+            json.dump(['FULTON', f'GENERATION{generation}'], out_file)
+        assert publish([str(election_directory)], str(tmp_path / 'data'), brotli=False)
+        generations.append(load_json_file(str(publish_directory / 'manifest.json'))['files'])
+    assert len({files['counties.json'] for files in generations}) == 3
+    assert len({files['json/FULTON.json'] for files in generations}) == 1
+    for files in generations[1:]:
+        for hashed_path in files.values():
+            assert (publish_directory / hashed_path).is_file() and (publish_directory / f'{hashed_path}.gz').is_file()
+    assert not (publish_directory / generations[0]['counties.json']).exists()
+    assert not (publish_directory / f"{generations[0]['counties.json']}.gz").exists()
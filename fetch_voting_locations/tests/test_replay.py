@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from fetch_voting_locations.scrape import get_sos_locations_url
+from fetch_voting_locations.utils.replay import ReplayServer, MAPBOX_FORWARD_PATH, get_sos_fixture_file_url, \
+    write_sos_fixture_pages
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        parameters = parse_qs(urlparse(self.path).query)
+        self.server.received.append(parameters)
+        if parameters.get('access_token') != ['secret']:
+            status, body = 401, dict(message='Not Authorized - Invalid Token')
+        else:
+            status, body = 200, dict(type='FeatureCollection', features=[dict(properties=dict(q=parameters['q'][0]))])
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def start_upstream():
+    upstream = ThreadingHTTPServer(('127.0.0.1', 0), UpstreamHandler)
+    upstream.received = []
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    return upstream
+
+
+def test_record_substitutes_the_real_access_token(tmp_path):
+    upstream = start_upstream()
+    host, port = upstream.server_address[:2]
+    try:
+        with ReplayServer(str(tmp_path), record_url=f'http://{host}:{port}', record_access_token='secret',
+                          synthesize_missing=False) as server:
+            url = f'{server.mapbox_forward_url}?q=1+Main+St&access_token=replay'
+            first = requests.get(url)
+            second = requests.get(url)
+    finally:
+        upstream.shutdown()
+        upstream.server_close()
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert first.json()['features'][0]['properties']['q'] == '1 Main St'
+    # the second request is answered from the recorded fixture
+    assert len(upstream.received) == 1
+    assert upstream.received[0]['access_token'] == ['secret']
+    assert len(os.listdir(tmp_path / 'mapbox')) == 1
+
+
+def test_record_failure_is_not_saved(tmp_path):
+    upstream = start_upstream()
+    host, port = upstream.server_address[:2]
+    try:
+        with ReplayServer(str(tmp_path), record_url=f'http://{host}:{port}', record_access_token='wrong',
+                          synthesize_missing=False) as server:
+            response = requests.get(f'{server.url}{MAPBOX_FORWARD_PATH}?q=1+Main+St&access_token=replay')
+    finally:
+        upstream.shutdown()
+        upstream.server_close()
+    assert response.status_code == 404
+    assert not (tmp_path / 'mapbox').exists()
+
+
+def test_sos_fixture_pages_load_from_file_urls(tmp_path):
+    file_paths = write_sos_fixture_pages([dict(name='A')], str(tmp_path), 'e1', 'BEN HILL')
+    url = get_sos_locations_url('e1', 'BEN HILL', get_sos_fixture_file_url(str(tmp_path)))
+    assert url.startswith('file://')
+    assert urlparse(url).path.replace('%20', ' ') == file_paths[0]
@@ -0,0 +1,55 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import fetch_voting_locations.fetch_early_voting_locations
+import fetch_voting_locations.scrape
+from fetch_voting_locations.location_files import load_json_file
+from fetch_voting_locations.utils.replay import replay_mapbox_geocoding
+
+REPOSITORY_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+ELECTION_ID = 'a0pcs00000J6e6HAAR'
+BASELINE_DIRECTORY = os.path.join(REPOSITORY_DIRECTORY, 'data', ELECTION_ID)
+SCENARIOS_FILE = os.path.join(REPOSITORY_DIRECTORY, 'scenarios.json')
+
+
+@pytest.fixture
+def replayed_election(tmp_path, replay_server, manual_selections, no_county_bounding_boxes, monkeypatch):
+    # the checked in county files stand in for the SOS pages, minus the positions geocoding adds; scraping them
+    # through the replay server needs a browser, so the scrape itself is the one stage left out
+    if not os.path.isdir(BASELINE_DIRECTORY):
+        pytest.skip(f'No baseline election data at {BASELINE_DIRECTORY}')
+
+    def fetch_pages(election_id, county, base_url=None):
+        county_file = os.path.join(BASELINE_DIRECTORY, 'json', f'{county}.json')
+        locations = load_json_file(county_file) if os.path.isfile(county_file) else []
+        return [{k: v for k, v in location.items() if k not in ('lat', 'lng')} for location in locations], 1
+
+    monkeypatch.setattr(fetch_voting_locations.scrape, 'fetch_early_voting_location_pages', fetch_pages)
+    # the census county file is not checked in, so the saved boundaries are copied instead
+    monkeypatch.setattr(fetch_voting_locations.fetch_early_voting_locations, 'save_state_county_boundaries',
+                        lambda **kwargs: None)
+    election_directory = tmp_path / 'data' / ELECTION_ID
+    shutil.copytree(os.path.join(BASELINE_DIRECTORY, 'county_boundaries'), election_directory / 'county_boundaries')
+    shutil.copy(os.path.join(BASELINE_DIRECTORY, 'counties.json'), election_directory / 'counties.json')
+    fetch_voting_locations.scrape.get_list_of_counties.cache_clear()
+    with replay_mapbox_geocoding(replay_server, str(tmp_path / 'mapbox_geocode_cache')):
+        yield election_directory
+    fetch_voting_locations.scrape.get_list_of_counties.cache_clear()
+
+
+@pytest.mark.parametrize('pipelined', [False, True])
+def test_scenarios_match_the_baseline(replayed_election, replay_server, pipelined):
+    fetch_voting_locations.fetch_early_voting_locations.main(
+        SCENARIOS_FILE, election_id=ELECTION_ID, output_directory=str(replayed_election.parent), pipelined=pipelined,
+        publish_outputs=False)
+    assert replay_server.requests_served > 0
+    with open(os.path.join(BASELINE_DIRECTORY, 'scenarios', 'scenarios.json'), 'rt') as in_file:
+        baseline = json.load(in_file)
+    assert load_json_file(str(replayed_election / 'scenarios' / 'scenarios.json')) == baseline
+    for county in load_json_file(str(replayed_election / 'counties.json')):
+        county_file = replayed_election / 'json' / f'{county}.json'
+        if county_file.is_file():
+            assert all('lat' in location and 'lng' in location for location in load_json_file(str(county_file)))
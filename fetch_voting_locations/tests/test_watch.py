@@ -0,0 +1,31 @@
+import fetch_voting_locations.geocoding
+import fetch_voting_locations.watch
+from fetch_voting_locations.progress import ProgressManifest
+from fetch_voting_locations.watch import WatchStatus, rescrape_county
+
+
+def test_ambiguous_geocodes_are_deferred_and_reported(tmp_path, monkeypatch):
+    scraped = [{'name': 'City Hall', 'address': '1 Main St, Atlanta, GA 30303', 'county': 'FULTON',
+                'schedule': []}]
+    monkeypatch.setattr(fetch_voting_locations.watch, 'fetch_early_voting_location_pages',
+                        lambda election_id, county, base_url: ([dict(location) for location in scraped], 1))
+
+    def geocode_locations(locations, county, interactive=True, deferred_locations=None):
+        assert not interactive
+        deferred_locations.extend(locations)
+        return False
+
+    monkeypatch.setattr(fetch_voting_locations.geocoding, 'geocode_locations', geocode_locations)
+    deferred_locations = []
+    location_count, locations = rescrape_county('election', 'FULTON', str(tmp_path), {},
+                                                ProgressManifest(str(tmp_path)), deferred_locations=deferred_locations)
+    assert location_count == 1 and [location['name'] for location in deferred_locations] == ['City Hall']
+
+    status = WatchStatus()
+    status.set_deferred_geocodes('FULTON', deferred_locations)
+    status.finish_cycle(dict(failed_counties=[]))
+    assert status.health()['status'] == 'degraded'
+    assert status.health()['deferred_geocodes'] == {'FULTON': ['City Hall']}
+    assert status.metrics()['deferred_geocodes'] == 1
+    status.set_deferred_geocodes('FULTON', [])
+    assert status.health()['status'] == 'ok'
@@ -15,13 +15,13 @@ class JSONCache {
         return Promise.resolve(response.json());
     }
 
-    static async #loadJSON(filePath) {
-        return fetch(filePath).then(JSONCache.#status).then(JSONCache.#json);
+    static async #loadJSON(filePath, options = undefined) {
+        return fetch(filePath, options).then(JSONCache.#status).then(JSONCache.#json);
     }
 
-    async getJSON(filePath) {
+    async getJSON(filePath, options = undefined) {
         if (!(filePath in this.#cache)) {
-            this.#cache[filePath] = await JSONCache.#loadJSON(filePath);
+            this.#cache[filePath] = await JSONCache.#loadJSON(filePath, options);
         }
         return this.#cache[filePath];
     }
@@ -88,6 +88,7 @@ class DataSet {
     #electionID = 'a0pcs00000J6e6HAAR';
     #stateName = 'Georgia';
     #dataPath;
+    #manifest = null;
     #counties = null;
     #scenarioNames = null;
     #scenarioDates = null;
@@ -102,24 +103,41 @@ class DataSet {
         this.#dataPath = `./data/${this.#electionID}/`
     }
 
+    async #getManifest() {
+        if (this.#manifest == null) {
+            // the manifest is the only published file whose name does not change, so it is always revalidated
+            this.#manifest = this.#jsonCache.getJSON(`${this.#dataPath}published/manifest.json`, {cache: 'no-cache'})
+                .catch(() => ({'files': {}}));
+        }
+        return this.#manifest;
+    }
+
+    async #getDataJSON(relativePath) {
+        let publishedPath = (await this.#getManifest())['files'][relativePath];
+        if (publishedPath) {
+            return this.#jsonCache.getJSON(`${this.#dataPath}published/${publishedPath}`);
+        }
+        return this.#jsonCache.getJSON(`${this.#dataPath}/${relativePath}`);
+    }
+
     async getCounties() {
         if (this.#counties == null) {
-            let values = await this.#jsonCache.getJSON(`${this.#dataPath}/counties.json`);
+            let values = await this.#getDataJSON('counties.json');
             this.#counties = new StringValueSet(values, 'County', DataSet.AllCountiesID(), 'upper')
         }
         return this.#counties;
     }
 
     async #getCountyBoundaries() {
-        return await this.#jsonCache.getJSON(`${this.#dataPath}/county_boundaries/${this.#stateName}.geojson`);
+        return await this.#getDataJSON(`county_boundaries/${this.#stateName}.geojson`);
     }
 
     async #getCountyCentroids() {
-        return await this.#jsonCache.getJSON(`${this.#dataPath}/county_boundaries/${this.#stateName}_centroids.geojson`);
+        return await this.#getDataJSON(`county_boundaries/${this.#stateName}_centroids.geojson`);
     }
 
     async #getCountyBoundingBoxes() {
-        return await this.#jsonCache.getJSON(`${this.#dataPath}/county_boundaries/${this.#stateName}_bounds.json`);
+        return await this.#getDataJSON(`county_boundaries/${this.#stateName}_bounds.json`);
     }
 
     async #filterCountyGeometry(countyName, centroids = false, mustMatch = true) {
@@ -156,15 +174,15 @@ class DataSet {
     }
 
     async #getGeoJSON(countyName) {
-        return this.#jsonCache.getJSON(`${this.#dataPath}/geojson/${countyName}.geojson`);
+        return this.#getDataJSON(`geojson/${countyName}.geojson`);
     }
 
     async #getJSON(countyName) {
-        return this.#jsonCache.getJSON(`${this.#dataPath}/json/${countyName}.json`)
+        return this.#getDataJSON(`json/${countyName}.json`)
     }
 
     async #getScenariosJSON() {
-        return this.#jsonCache.getJSON(`${this.#dataPath}/scenarios/scenarios.json`);
+        return this.#getDataJSON('scenarios/scenarios.json');
     }
 
     async getScenarioNames() {
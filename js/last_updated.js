@@ -4,6 +4,17 @@ const github_repo_owner = 'thisisnotdalton';
 const github_repo_name = 'GeorgiaVotingLocations';
 const url = `https://api.github.com/repos/${github_repo_owner}/${github_repo_name}/branches/master`;
 const lastUpdatedElementID = "lastUpdated";
+// written by the fetch_voting_locations publish stage whenever the published data changes
+const publishedLastUpdatedPath = './data/published/last_updated.json';
+
+async function getPublishedDate(cache) {
+    try {
+        let published = await cache.getJSON(publishedLastUpdatedPath, {cache: 'no-cache'});
+        return new Date(Date.parse(published.last_updated));
+    } catch (e) {
+        return null;
+    }
+}
 
 export async function getLastUpdated() {
     let cache = new JSONCache();
@@ -13,6 +24,11 @@ export async function getLastUpdated() {
         let commitURL = commitProperties.commit.html_url;
         let commitDate = commitProperties.commit.commit.author.date;
         commitDate = new Date(Date.parse(commitDate));
+        // data published after the last commit is newer than the commit date
+        let publishedDate = await getPublishedDate(cache);
+        if (publishedDate && publishedDate > commitDate) {
+            commitDate = publishedDate;
+        }
         commitDate = commitDate.toDateString();
         lastUpdatedElement.innerHTML = commitDate;
         lastUpdatedElement.href = commitURL;